@@ -0,0 +1,83 @@
+import copy
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.authentication import TokenAuthentication
+
+from .caching import get_version, invalidate_on_commit
+
+CACHE_NAME = 'auth-tokens'
+PER_PROCESS_BACKENDS = (LocMemCache, DummyCache)
+
+
+class TokenCache:
+    """LRU токен -> (пользователь, токен) с ограниченным временем жизни.
+
+    Записи живут в памяти процесса. Версия в кэше Django сбрасывает их
+    после выхода, смены пароля или деактивации; во всех процессах сразу
+    только если этот кэш общий (Redis, Memcached, база данных).
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._version = None
+
+    def get(self, key):
+        version = get_version(CACHE_NAME)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (
+                monotonic() + settings.AUTH_TOKEN_CACHE_TTL, value
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def invalidate():
+        # До коммита параллельный запрос успел бы закэшировать старого
+        # пользователя или удаляемый токен уже под новой версией.
+        invalidate_on_commit(CACHE_NAME)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для недавно виденных токенов.
+
+    С LocMemCache сброс версии не дошёл бы до других воркеров gunicorn, и
+    отозванный токен работал бы там до конца TTL. Поэтому без общего кэша
+    класс ведёт себя как обычный TokenAuthentication.
+    """
+
+    def authenticate_credentials(self, key):
+        if isinstance(caches[DEFAULT_CACHE_ALIAS], PER_PROCESS_BACKENDS):
+            return super().authenticate_credentials(key)
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        # Каждый запрос получает свою копию: view может менять пользователя.
+        return copy.copy(user), token
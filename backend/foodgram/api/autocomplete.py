@@ -0,0 +1,81 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+from django.db import connection
+from django.db.models.functions import Length
+
+from recipes.models import Ingredient
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+
+class IngredientPrefixIndex:
+    """Каталог ингредиентов в памяти для поиска по префиксу.
+
+    Используется вместо функционального индекса, когда база данных
+    не PostgreSQL (например, SQLite при локальной разработке).
+    Названия разложены по длине в отсортированные списки, поэтому
+    результаты сразу идут в порядке ранжирования: короче — выше.
+    """
+
+    def __init__(self):
+        self._buckets = None
+        self._lock = Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._buckets = None
+
+    def _build(self):
+        buckets = defaultdict(list)
+        for row in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).iterator():
+            key = row[1].lower()
+            buckets[len(key)].append((key, row))
+        return [
+            ([item[0] for item in items], [item[1] for item in items])
+            for _, items in sorted(
+                (length, sorted(items)) for length, items in buckets.items()
+            )
+        ]
+
+    def _load(self):
+        with self._lock:
+            if self._buckets is None:
+                self._buckets = self._build()
+            return self._buckets
+
+    def search(self, prefix, limit):
+        prefix = prefix.lower()
+        found = []
+        for keys, rows in self._load():
+            if len(keys[0]) < len(prefix):
+                continue
+            start = bisect_left(keys, prefix)
+            end = bisect_left(keys, prefix + '\uffff', start)
+            found.extend(rows[start:min(end, start + limit - len(found))])
+            if len(found) == limit:
+                break
+        return [
+            {'id': id, 'name': name, 'measurement_unit': measurement_unit}
+            for id, name, measurement_unit in found
+        ]
+
+
+prefix_index = IngredientPrefixIndex()
+
+
+def autocomplete(prefix, limit=DEFAULT_LIMIT):
+    limit = max(1, min(limit, MAX_LIMIT))
+    if connection.vendor != 'postgresql':
+        return prefix_index.search(prefix, limit)
+    return list(
+        Ingredient.objects.filter(
+            name__istartswith=prefix
+        ).order_by(
+            Length('name'), 'name'
+        ).values('id', 'name', 'measurement_unit')[:limit]
+    )
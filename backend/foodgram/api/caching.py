@@ -0,0 +1,106 @@
+import hashlib
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .renderers import Fragment, dumps
+
+PREFIX = 'reference'
+
+
+def version_key(name):
+    return f'{PREFIX}:{name}:version'
+
+
+def get_version(name):
+    version = cache.get(version_key(name))
+    if version is None:
+        version = uuid4().hex
+        cache.add(version_key(name), version, timeout=None)
+        version = cache.get(version_key(name), version)
+    return version
+
+
+def invalidate(name):
+    version = uuid4().hex
+    cache.set(version_key(name), version, timeout=None)
+    return version
+
+
+def invalidate_on_commit(name):
+    """Сбрасывает кэш после коммита, чтобы не закэшировать старые строки."""
+    transaction.on_commit(lambda: invalidate(name))
+
+
+def make_etag(data):
+    return '"{}"'.format(hashlib.md5(dumps(data)).hexdigest())
+
+
+def get_or_build(name, suffix, build):
+    digest = hashlib.md5(suffix.encode()).hexdigest()
+    key = f'{PREFIX}:{name}:{get_version(name)}:{digest}'
+    payload = cache.get(key)
+    if payload is None:
+        data = build()
+        payload = (make_etag(data), data)
+        cache.set(key, payload, timeout=settings.REFERENCE_CACHE_TIMEOUT)
+    return payload
+
+
+class ReferenceCacheMixin:
+    """Отдаёт list и retrieve из кэша справочников с поддержкой ETag.
+
+    В кэше хранится уже закодированный JSON: ответ вставляется как
+    Fragment без повторного кодирования. Кэш сбрасывается сигналами
+    при изменении моделей справочника.
+    """
+
+    cache_name = None
+
+    def cache_params(self, request):
+        """Параметры запроса, от которых зависит список: поля фильтра.
+
+        Остальные параметры не попадают в ключ, иначе каждый
+        ``?junk=...`` создавал бы новую запись в кэше.
+        """
+        filterset_class = getattr(self, 'filterset_class', None)
+        accepted = filterset_class.base_filters if filterset_class else ()
+        return urlencode(sorted(
+            (key, values) for key, values in request.query_params.lists()
+            if key in accepted
+        ), doseq=True)
+
+    def cached_response(self, request, suffix, build):
+        etag, data = get_or_build(
+            self.cache_name, suffix, lambda: Fragment(dumps(build()))
+        )
+        if request.headers.get('If-None-Match') == etag:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            f'list?{self.cache_params(request)}',
+            lambda: super(ReferenceCacheMixin, self).list(
+                request, *args, **kwargs
+            ).data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            request,
+            f'detail:{lookup}',
+            lambda: super(ReferenceCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            ).data
+        )
@@ -0,0 +1,210 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.images import thumbnail_name
+from recipes.models import IngredientInRecipe, Recipe, Tag
+from users.models import Subscription
+from .caching import PREFIX, get_or_build, get_version, invalidate_on_commit
+from .fields import thumbnail_url
+from .renderers import Fragment, dumps
+
+User = get_user_model()
+
+ROW_FIELDS = ('id', 'author_id', 'is_favorited', 'is_in_shopping_cart')
+RECIPE_FIELDS = ('id', 'name', 'image', 'text', 'cooking_time')
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+IMAGE_VARIANT = 'detail'
+CACHE_NAME = 'recipe-representations'
+
+
+def get_tags():
+    """Теги, заранее закодированные в JSON, из кэша справочника."""
+    _, tags = get_or_build('tags', 'fragments', lambda: {
+        tag['id']: Fragment(dumps(tag))
+        for tag in Tag.objects.values('id', 'name', 'color', 'slug')
+    })
+    return tags
+
+
+def recipe_key(recipe_id, version=None):
+    version = version or get_version(CACHE_NAME)
+    return f'{PREFIX}:{CACHE_NAME}:{version}:recipe:{recipe_id}'
+
+
+def author_key(author_id, version=None):
+    version = version or get_version(CACHE_NAME)
+    return f'{PREFIX}:{CACHE_NAME}:{version}:author:{author_id}'
+
+
+def forget(make_key, ids):
+    """Удаляет записи после коммита.
+
+    До коммита читатель пересобрал бы запись из старых строк. Запись,
+    собранная параллельно с коммитом, живёт не дольше
+    RECIPE_CACHE_TIMEOUT.
+    """
+    ids = list(ids)
+
+    def delete():
+        version = get_version(CACHE_NAME)
+        cache.delete_many([make_key(pk, version) for pk in ids])
+
+    transaction.on_commit(delete)
+
+
+def forget_recipes(recipe_ids):
+    forget(recipe_key, recipe_ids)
+
+
+def forget_authors(author_ids):
+    forget(author_key, author_ids)
+
+
+def forget_all():
+    invalidate_on_commit(CACHE_NAME)
+
+
+def recipe_rows(queryset):
+    """Строки рецептов для serialize_recipes вместо объектов модели.
+
+    Ожидает queryset из Recipe.objects.for_user с аннотациями
+    is_favorited и is_in_shopping_cart.
+    """
+    return queryset.prefetch_related(None).values(*ROW_FIELDS)
+
+
+def build_recipes(recipe_ids):
+    """Не зависящая от пользователя часть представления рецептов."""
+    storage = Recipe._meta.get_field('image').storage
+    tag_ids = defaultdict(list)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        recipe__in=recipe_ids
+    ).order_by('tag_id').values_list('recipe_id', 'tag_id'):
+        tag_ids[recipe_id].append(tag_id)
+    ingredients = defaultdict(list)
+    for recipe_id, *row in IngredientInRecipe.objects.filter(
+        recipe__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ):
+        ingredients[recipe_id].append(dict(zip(
+            ('id', 'name', 'measurement_unit', 'amount'), row
+        )))
+    recipes = {}
+    for recipe in Recipe.objects.filter(id__in=recipe_ids).values(
+        *RECIPE_FIELDS
+    ):
+        thumbnail = recipe['image'] and thumbnail_name(
+            recipe['image'], IMAGE_VARIANT
+        )
+        recipes[recipe['id']] = {
+            **recipe,
+            'tag_ids': tag_ids[recipe['id']],
+            'ingredients': Fragment(dumps(ingredients[recipe['id']])),
+            # Ссылка кэшируется, только когда уменьшенная копия готова;
+            # до этого запись сбросит сигнал thumbnails_ready.
+            'image_url': (
+                storage.url(thumbnail)
+                if thumbnail and storage.exists(thumbnail) else None
+            ),
+        }
+    return recipes
+
+
+def build_authors(author_ids):
+    return {
+        author['id']: author
+        for author in User.objects.filter(id__in=author_ids).values(
+            *AUTHOR_FIELDS
+        )
+    }
+
+
+def get_cached(ids, make_key, build):
+    version = get_version(CACHE_NAME)
+    keys = {make_key(pk, version): pk for pk in ids}
+    found = {
+        keys[key]: value for key, value in cache.get_many(keys).items()
+    }
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {make_key(pk, version): value for pk, value in built.items()},
+            timeout=settings.RECIPE_CACHE_TIMEOUT
+        )
+        found.update(built)
+    return found
+
+
+def get_subscribed(author_ids, user):
+    if user.is_anonymous:
+        return set()
+    return set(Subscription.objects.filter(
+        user=user, author__in=author_ids
+    ).values_list('author', flat=True))
+
+
+def image_urls(recipes, request):
+    """Абсолютные ссылки на картинки, по одной на каждый файл."""
+    storage = Recipe._meta.get_field('image').storage
+    urls = {
+        recipe_id: recipe['image_url'] or (
+            recipe['image'] and thumbnail_url(
+                storage, recipe['image'], IMAGE_VARIANT
+            )
+        )
+        for recipe_id, recipe in recipes.items()
+    }
+    absolute = {
+        url: request.build_absolute_uri(url)
+        for url in set(urls.values()) if url
+    }
+    return {
+        recipe_id: absolute.get(url) for recipe_id, url in urls.items()
+    }
+
+
+def serialize_recipes(rows, request):
+    """Ответ RecipeReadSerializer(many=True) из кэша представлений.
+
+    Общая для всех пользователей часть рецептов и авторов берётся из
+    кэша одним get_many, промахи собираются пакетно. Флаги пользователя
+    приходят из строк queryset и одного запроса подписок. Порядок ключей
+    и значения совпадают с RecipeReadSerializer.
+    """
+    rows = list(rows)
+    recipes = get_cached(
+        [row['id'] for row in rows], recipe_key, build_recipes
+    )
+    author_ids = list({row['author_id'] for row in rows})
+    authors = get_cached(author_ids, author_key, build_authors)
+    subscribed = get_subscribed(author_ids, request.user)
+    tags = get_tags()
+    images = image_urls(recipes, request)
+    return [
+        {
+            'id': row['id'],
+            'tags': [
+                tags[pk] for pk in recipe['tag_ids'] if pk in tags
+            ],
+            'author': {
+                **authors[row['author_id']],
+                'is_subscribed': row['author_id'] in subscribed,
+            },
+            'ingredients': recipe['ingredients'],
+            'is_favorited': row['is_favorited'],
+            'is_in_shopping_cart': row['is_in_shopping_cart'],
+            'name': recipe['name'],
+            'image': images[row['id']],
+            'text': recipe['text'],
+            'cooking_time': recipe['cooking_time'],
+        }
+        for row in rows
+        for recipe in (recipes.get(row['id']),) if recipe is not None
+    ]
@@ -0,0 +1,27 @@
+from drf_extra_fields.fields import Base64ImageField
+
+from recipes.images import thumbnail_name
+
+
+def thumbnail_url(storage, name, variant, request=None):
+    """Ссылка на уменьшенную копию картинки, если она готова."""
+    thumbnail = thumbnail_name(name, variant)
+    url = storage.url(thumbnail if storage.exists(thumbnail) else name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class ThumbnailImageField(Base64ImageField):
+    """Отдаёт ссылку на уменьшенную копию картинки, если она готова."""
+
+    def __init__(self, *args, variant, **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def to_representation(self, file):
+        if not file:
+            return None
+        return thumbnail_url(
+            file.storage, file.name, self.variant, self.context.get('request')
+        )
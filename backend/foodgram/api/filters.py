@@ -1,6 +1,20 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
 from recipes.models import Ingredient, Recipe, Tag
+from .caching import get_or_build
+from .search import search_recipes
+
+
+def get_tag_ids():
+    _, tag_ids = get_or_build(
+        'tags', 'slug-ids', lambda: dict(Tag.objects.values_list('slug', 'id'))
+    )
+    return tag_ids
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class IngredientFilter(filters.FilterSet):
@@ -15,12 +29,49 @@ class IngredientFilter(filters.FilterSet):
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags',
+    )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'), ('trending', 'trending')),
+        method='filter_ordering',
     )
+    is_favorited = filters.BooleanFilter(method='filter_user_flag')
+    is_in_shopping_cart = filters.BooleanFilter(method='filter_user_flag')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', )
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+
+    def filter_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag__in=[tag_ids[slug] for slug in value],
+            )
+        ))
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по индексу рейтинга (field, recipe) по убыванию.
+
+        Строка рейтинга есть у каждого рецепта, поэтому условие ничего
+        не отсекает, а только превращает LEFT JOIN в INNER JOIN.
+        """
+        field = 'popularity' if value == 'popular' else 'trending'
+        return queryset.filter(ranking__isnull=False).order_by(
+            f'-ranking__{field}', '-id'
+        )
+
+    def filter_user_flag(self, queryset, name, value):
+        """Фильтрует по Exists-аннотации из Recipe.objects.for_user()."""
+        if not value:
+            return queryset
+        if self.request.user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(**{name: True})
@@ -0,0 +1,393 @@
+import base64
+import json
+import subprocess
+from collections import namedtuple
+from io import BytesIO
+from statistics import mean
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.query_budget import record_queries
+from recipes.management.commands.generate_data import DEFAULT_PASSWORD
+from recipes.models import FeedEntry, Ingredient, Recipe, Tag
+from users.models import Subscription
+
+User = get_user_model()
+
+Scenario = namedtuple(
+    'Scenario',
+    'name method path data auth setup undo settings',
+    defaults=(None, True, None, None, None),
+)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+
+def image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), '#49B64E').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_scenarios(ctx):
+    recipe = f'/api/recipes/{ctx["recipe"]}/'
+    author = f'/api/users/{ctx["author"]}/'
+    ids = {'recipes': ctx['other_recipes']}
+    recipe_data = {
+        'ingredients': [
+            {'id': pk, 'amount': 100} for pk in ctx['ingredients']
+        ],
+        'tags': [ctx['tag']],
+        'image': image_data(),
+        'name': 'бенчмарк',
+        'text': 'рецепт для замеров',
+        'cooking_time': 30,
+    }
+    scenarios = [
+        Scenario('api-root', 'get', '/api/'),
+        Scenario('tags-list', 'get', '/api/tags/'),
+        Scenario('tags-detail', 'get', f'/api/tags/{ctx["tag"]}/'),
+        Scenario(
+            'ingredients-list', 'get',
+            f'/api/ingredients/?name={ctx["prefix"]}'
+        ),
+        Scenario(
+            'ingredients-detail', 'get',
+            f'/api/ingredients/{ctx["ingredients"][0]}/'
+        ),
+        Scenario(
+            'ingredients-autocomplete', 'get',
+            f'/api/ingredients/autocomplete/?name={ctx["prefix"]}'
+        ),
+        Scenario(
+            'recipes-list-anonymous', 'get', '/api/recipes/', auth=False
+        ),
+        Scenario('recipes-list', 'get', '/api/recipes/'),
+        Scenario('recipes-list-page-10', 'get', '/api/recipes/?page=10'),
+        Scenario(
+            'recipes-list-cursor', 'get', '/api/recipes/?pagination=cursor'
+        ),
+        Scenario(
+            'recipes-filter-tags', 'get', f'/api/recipes/?tags={ctx["slug"]}'
+        ),
+        Scenario(
+            'recipes-filter-author', 'get',
+            f'/api/recipes/?author={ctx["author"]}'
+        ),
+        Scenario('recipes-favorited', 'get', '/api/recipes/?is_favorited=1'),
+        Scenario(
+            'recipes-in-cart', 'get', '/api/recipes/?is_in_shopping_cart=1'
+        ),
+        Scenario(
+            'recipes-search', 'get', f'/api/recipes/?search={ctx["word"]}'
+        ),
+        Scenario('recipes-popular', 'get', '/api/recipes/?ordering=popular'),
+        Scenario(
+            'recipes-trending', 'get', '/api/recipes/?ordering=trending'
+        ),
+        Scenario('recipes-detail', 'get', recipe),
+        Scenario(
+            'recipes-match', 'get',
+            '/api/recipes/match/?ingredients='
+            + ','.join(map(str, ctx['ingredients']))
+        ),
+        Scenario(
+            'recipes-shopping-cart-totals', 'get',
+            '/api/recipes/shopping_cart_totals/'
+        ),
+        Scenario('users-list', 'get', '/api/users/'),
+        Scenario('users-detail', 'get', author),
+        Scenario('users-me', 'get', '/api/users/me/'),
+        Scenario(
+            'users-subscriptions', 'get',
+            '/api/users/subscriptions/?recipes_limit=3'
+        ),
+        Scenario(
+            'users-subscribe', 'post', author + 'subscribe/',
+            setup=('delete', author + 'subscribe/'),
+        ),
+        Scenario(
+            'users-unsubscribe', 'delete', author + 'subscribe/',
+            setup=('post', author + 'subscribe/'),
+        ),
+        Scenario(
+            'auth-token-login', 'post', '/api/auth/token/login/',
+            {'email': ctx['email'], 'password': DEFAULT_PASSWORD},
+            auth=False,
+        ),
+        Scenario(
+            'recipes-create', 'post', '/api/recipes/', recipe_data,
+            undo=('delete', '/api/recipes/{created}/'),
+        ),
+        Scenario(
+            'recipes-delete', 'delete', '/api/recipes/{created}/',
+            setup=('post', '/api/recipes/', recipe_data),
+        ),
+    ]
+    if ctx['own_recipe'] is not None:
+        own_recipe = f'/api/recipes/{ctx["own_recipe"]["id"]}/'
+        scenarios.append(Scenario(
+            'recipes-update', 'patch', own_recipe, recipe_data,
+            undo=('patch', own_recipe, ctx['own_recipe']['data']),
+        ))
+    for action in ('favorite', 'shopping_cart'):
+        path = f'{recipe}{action}/'
+        bulk = f'/api/recipes/bulk_{action}/'
+        scenarios += [
+            Scenario(f'recipes-{action}-add', 'post', path,
+                     setup=('delete', path)),
+            Scenario(f'recipes-{action}-remove', 'delete', path,
+                     setup=('post', path)),
+            Scenario(f'recipes-bulk-{action}-add', 'post', bulk, ids,
+                     setup=('delete', bulk, ids)),
+            Scenario(f'recipes-bulk-{action}-remove', 'delete', bulk, ids,
+                     setup=('post', bulk, ids)),
+        ]
+    for file_type in ('txt', 'csv', 'pdf'):
+        scenarios.append(Scenario(
+            f'recipes-download-{file_type}', 'get',
+            f'/api/recipes/download_shopping_cart/?type={file_type}'
+        ))
+    for strategy in ('read', 'write'):
+        scenarios += [
+            Scenario(
+                f'recipes-feed-{strategy}', 'get', '/api/recipes/feed/',
+                settings={'FEED_STRATEGY': strategy},
+            ),
+            # Рецепт от автора с наибольшим числом подписчиков: при write
+            # в замер входят fan_out и prune по лентам всех подписчиков.
+            Scenario(
+                f'recipes-create-popular-{strategy}', 'post', '/api/recipes/',
+                recipe_data, auth='popular',
+                undo=('delete', '/api/recipes/{created}/'),
+                settings={'FEED_STRATEGY': strategy},
+            ),
+        ]
+    return scenarios
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет маршруты API через тестовый клиент и сохраняет '
+        'p50/p95, число запросов к БД и размер ответов в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут запросы'
+        )
+        parser.add_argument(
+            '--only', default='', help='Подстрока в имени сценария'
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего прогона для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        ctx = self.build_context(options['user'])
+        clients = {False: APIClient(HTTP_HOST='localhost')}
+        for auth, token in ((True, ctx['token']), ('popular', ctx['popular'])):
+            clients[auth] = APIClient(HTTP_HOST='localhost')
+            clients[auth].credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        scenarios = [
+            scenario for scenario in build_scenarios(ctx)
+            if options['only'] in scenario.name
+        ]
+        call_command('rebuild_feeds', stdout=self.stdout)
+        try:
+            results = [
+                self.run(clients[scenario.auth], scenario, options)
+                for scenario in scenarios
+            ]
+        finally:
+            if settings.FEED_STRATEGY != 'write':
+                FeedEntry.objects.all().delete()
+        report = {
+            'commit': git_commit(),
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'subscriptions': Subscription.objects.count(),
+                'max_subscribers': ctx['max_subscribers'],
+            },
+            'results': results,
+        }
+        self.print_results(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def build_context(email):
+        user = (
+            User.objects.filter(email=email).first() if email
+            else User.objects.filter(
+                id__in=Subscription.objects.values('user')
+            ).order_by('id').first()
+        )
+        if user is None:
+            raise CommandError(
+                'Нет подходящего пользователя, запустите generate_data'
+            )
+        author = Subscription.objects.filter(user=user).values_list(
+            'author', flat=True
+        ).first()
+        recipes = list(Recipe.objects.exclude(author=user).order_by(
+            '-favorites_count'
+        ).values_list('id', flat=True)[:11])
+        ingredients = list(Ingredient.objects.filter(
+            ingredient_in_recipe__recipe=recipes[0]
+        )[:3])
+        tag = Tag.objects.filter(recipe=recipes[0]).first()
+        popular = User.objects.order_by('-subscribers_count', 'id').first()
+        return {
+            'email': user.email,
+            'token': Token.objects.get_or_create(user=user)[0].key,
+            'popular': Token.objects.get_or_create(user=popular)[0].key,
+            'max_subscribers': popular.subscribers_count,
+            'author': author,
+            'recipe': recipes[0],
+            'other_recipes': recipes[1:],
+            'own_recipe': Command.recipe_payload(
+                Recipe.objects.filter(author=user).first()
+            ),
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'prefix': ingredients[0].name[:2],
+            'word': Recipe.objects.get(pk=recipes[0]).name.split()[-1],
+            'tag': tag.id,
+            'slug': tag.slug,
+        }
+
+    @staticmethod
+    def recipe_payload(recipe):
+        """Данные для PATCH, возвращающего рецепт в исходное состояние."""
+        if recipe is None:
+            return None
+        ingredients = recipe.ingredient_in_recipe.order_by('id')
+        data = {
+            'ingredients': [
+                {'id': ingredient_id, 'amount': amount}
+                for ingredient_id, amount in ingredients.values_list(
+                    'ingredient', 'amount'
+                )
+            ],
+            'tags': list(recipe.tags.order_by('id').values_list(
+                'id', flat=True
+            )),
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+        try:
+            with recipe.image.open('rb') as image:
+                data['image'] = 'data:image;base64,' + base64.b64encode(
+                    image.read()
+                ).decode()
+        except (OSError, ValueError):
+            pass
+        return {'id': recipe.id, 'data': data}
+
+    def request(self, client, state, method, path, data=None):
+        response = getattr(client, method)(
+            path.format(**state), data, format='json'
+        )
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+            if method == 'post' and response.status_code == 201:
+                created = response.json()
+                if isinstance(created, dict) and 'id' in created:
+                    state['created'] = created['id']
+        return response.status_code, size
+
+    def run(self, client, scenario, options):
+        timings, queries, sizes, statuses = [], [], [], set()
+        state = {}
+        with override_settings(**(scenario.settings or {})):
+            total = options['warmup'] + options['iterations']
+            for iteration in range(total):
+                if scenario.setup:
+                    self.request(client, state, *scenario.setup)
+                with record_queries() as recorder:
+                    start = perf_counter()
+                    status, size = self.request(
+                        client, state, scenario.method, scenario.path,
+                        scenario.data
+                    )
+                    elapsed = perf_counter() - start
+                if scenario.undo:
+                    self.request(client, state, *scenario.undo)
+                if iteration >= options['warmup']:
+                    timings.append(elapsed * 1000)
+                    queries.append(recorder.count)
+                    sizes.append(size)
+                    statuses.add(status)
+        return {
+            'name': scenario.name,
+            'method': scenario.method.upper(),
+            'path': scenario.path,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'mean_ms': round(mean(timings), 2),
+            'queries': round(mean(queries), 1),
+            'bytes': round(mean(sizes)),
+        }
+
+    def print_results(self, results, compare):
+        previous = {}
+        if compare:
+            with open(compare, encoding='utf-8') as file:
+                previous = {
+                    row['name']: row for row in json.load(file)['results']
+                }
+        self.stdout.write(
+            f'{"scenario":36} {"status":>9} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"queries":>7} {"bytes":>9}'
+        )
+        for row in results:
+            line = (
+                f'{row["name"]:36} {",".join(map(str, row["status"])):>9} '
+                f'{row["p50_ms"]:8.2f} {row["p95_ms"]:8.2f} '
+                f'{row["queries"]:7} {row["bytes"]:9}'
+            )
+            old = previous.get(row['name'])
+            if old:
+                change = (row['p50_ms'] - old['p50_ms']) / old['p50_ms']
+                line += (
+                    f'  p50 {change:+.0%}, '
+                    f'queries {row["queries"] - old["queries"]:+}'
+                )
+            self.stdout.write(line)
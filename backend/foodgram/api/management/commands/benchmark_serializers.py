@@ -0,0 +1,111 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.compiled import recipe_rows, serialize_recipes
+from api.renderers import ORJSONRenderer
+from api.serializers import RecipeReadSerializer
+from recipes.models import Recipe
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def drf_path(request, size):
+    recipes = Recipe.objects.for_user(request.user)[:size]
+    return ORJSONRenderer().render(RecipeReadSerializer(
+        recipes, many=True, context={'request': request}
+    ).data)
+
+
+def compiled_path(request, size):
+    rows = recipe_rows(Recipe.objects.for_user(request.user))[:size]
+    return ORJSONRenderer().render(serialize_recipes(rows, request))
+
+
+PATHS = (
+    ('drf', drf_path),
+    ('compiled', compiled_path),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает RecipeReadSerializer и компилированную сериализацию: '
+        'страниц и рецептов в секунду, совпадение JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[6, 50, 500]
+        )
+        parser.add_argument(
+            '--duration', type=float, default=2.0,
+            help='Секунд на каждый замер'
+        )
+        parser.add_argument('--anonymous', action='store_true')
+        parser.add_argument(
+            '--render-size', type=int, default=100,
+            help='Рецептов на странице при сравнении рендереров'
+        )
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get(
+            '/api/recipes/', HTTP_HOST='localhost'
+        )
+        request.user = (
+            AnonymousUser() if options['anonymous']
+            else User.objects.filter(
+                id__in=Subscription.objects.values('user')
+            ).order_by('id').first()
+        )
+        if request.user is None:
+            raise CommandError('Нет данных, запустите generate_data')
+        self.stdout.write(
+            f'{"size":>5} {"path":>9} {"pages/s":>9} {"recipes/s":>10}'
+        )
+        for size in options['sizes']:
+            outputs = {}
+            for name, path in PATHS:
+                outputs[name] = path(request, size)
+                rate = self.measure(path, request, size, options['duration'])
+                self.stdout.write(
+                    f'{size:5} {name:>9} {rate:9.1f} {rate * size:10.0f}'
+                )
+            if outputs['drf'] != outputs['compiled']:
+                raise CommandError(f'JSON различается при size={size}')
+        self.compare_renderers(request, options)
+        self.stdout.write(self.style.SUCCESS('JSON совпадает байт в байт'))
+
+    def compare_renderers(self, request, options):
+        data = RecipeReadSerializer(
+            Recipe.objects.for_user(request.user)[:options['render_size']],
+            many=True, context={'request': request}
+        ).data
+        outputs = {}
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            name = type(renderer).__name__
+            outputs[name] = renderer.render(data)
+            rate = self.measure(
+                lambda *args: renderer.render(data), None, None,
+                options['duration']
+            )
+            self.stdout.write(
+                f'render {options["render_size"]} recipes {name:>15}: '
+                f'{1000 / rate:.3f} ms'
+            )
+        if len(set(outputs.values())) != 1:
+            raise CommandError('Рендереры дают разный JSON')
+
+    @staticmethod
+    def measure(path, request, size, duration):
+        count = 0
+        start = perf_counter()
+        while perf_counter() - start < duration:
+            path(request, size)
+            count += 1
+        return count / (perf_counter() - start)
@@ -0,0 +1,111 @@
+import heapq
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+
+from recipes.models import IngredientInRecipe
+from .caching import get_version, invalidate
+
+CACHE_NAME = 'recipe-ingredients'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class IngredientMatcher:
+    """Инвертированный индекс ингредиент -> рецепты для подбора рецептов.
+
+    Списки рецептов хранятся отсортированными массивами ``array('q')``.
+    Изменения своего процесса применяются инкрементально; изменения
+    других процессов замечаются по версии в общем кэше и приводят
+    к полной пересборке не чаще, чем раз в MATCHER_MAX_STALENESS секунд.
+    """
+
+    def __init__(self):
+        self._postings = None
+        self._recipes = None
+        self._version = None
+        self._built_at = 0
+        self._lock = Lock()
+
+    def _build(self):
+        postings = defaultdict(lambda: array('q'))
+        recipes = defaultdict(list)
+        for ingredient_id, recipe_id in IngredientInRecipe.objects.values_list(
+            'ingredient', 'recipe'
+        ).order_by('ingredient_id', 'recipe_id').iterator():
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        self._postings = dict(postings)
+        self._recipes = {
+            recipe_id: tuple(ingredients)
+            for recipe_id, ingredients in recipes.items()
+        }
+        self._built_at = time.monotonic()
+
+    def _load(self):
+        version = get_version(CACHE_NAME)
+        with self._lock:
+            stale = (
+                version != self._version
+                and time.monotonic() - self._built_at
+                >= settings.MATCHER_MAX_STALENESS
+            )
+            if self._postings is None or stale:
+                self._build()
+                self._version = version
+            return self._postings, self._recipes
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            posting = self._postings[ingredient_id]
+            del posting[bisect_left(posting, recipe_id)]
+            if not posting:
+                del self._postings[ingredient_id]
+
+    def update_recipes(self, recipe_ids):
+        recipe_ids = set(recipe_ids)
+        rows = IngredientInRecipe.objects.filter(
+            recipe__in=recipe_ids
+        ).values_list('recipe', 'ingredient')
+        with self._lock:
+            if self._postings is not None:
+                for recipe_id in recipe_ids:
+                    self._remove(recipe_id)
+                recipes = defaultdict(list)
+                for recipe_id, ingredient_id in rows:
+                    recipes[recipe_id].append(ingredient_id)
+                    insort(
+                        self._postings.setdefault(ingredient_id, array('q')),
+                        recipe_id
+                    )
+                for recipe_id, ingredients in recipes.items():
+                    self._recipes[recipe_id] = tuple(ingredients)
+            previous = get_version(CACHE_NAME)
+            version = invalidate(CACHE_NAME)
+            if self._version == previous:
+                self._version = version
+
+    def match(self, ingredient_ids, limit=DEFAULT_LIMIT):
+        postings, recipes = self._load()
+        matched = defaultdict(int)
+        for ingredient_id in set(ingredient_ids):
+            for recipe_id in postings.get(ingredient_id, ()):
+                matched[recipe_id] += 1
+        best = heapq.nlargest(
+            limit,
+            matched.items(),
+            key=lambda item: (
+                item[1] / len(recipes[item[0]]), item[1], item[0]
+            )
+        )
+        return [
+            (recipe_id, count / len(recipes[recipe_id]))
+            for recipe_id, count in best
+        ]
+
+
+matcher = IngredientMatcher()
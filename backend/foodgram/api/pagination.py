@@ -1,6 +1,44 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация с переключением на курсорную.
+
+    Параметр ``pagination=cursor`` включает пагинацию по ключу ``-id``:
+    без COUNT(*) и OFFSET, стоимость страницы не зависит от её номера.
+    Курсор переупорядочил бы выдачу, поэтому с явной сортировкой
+    (ordering, search) курсорный режим отклоняется.
+    """
+
     page_size = 6
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+    cursor_pagination_class = CustomCursorPagination
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == 'cursor':
+            if queryset.query.order_by:
+                raise ValidationError({self.mode_query_param: [
+                    'Курсорная пагинация несовместима с сортировкой '
+                    'и поиском.'
+                ]})
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,164 @@
+import logging
+import re
+import sys
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.fields import Field
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDERS = re.compile(r'%s(?:\s*,\s*%s)+')
+FIELD_METHODS = frozenset(('get_attribute', 'to_representation'))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """SQL без различий в длине списков IN (%s, %s, ...)."""
+    return PLACEHOLDERS.sub('%s, ...', sql)
+
+
+def field_label():
+    """Поле сериализатора, при выводе которого выполняется запрос."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_name in FIELD_METHODS:
+            field = frame.f_locals.get('self')
+            if isinstance(field, Field) and field.parent is not None:
+                return f'{type(field.parent).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper, собирающая запросы одного блока кода."""
+
+    def __init__(self):
+        self.queries = []
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.queries.append((fingerprint(sql), field_label()))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def duplicates(self, threshold):
+        counts = Counter(sql for sql, _ in self.queries)
+        fields = defaultdict(set)
+        for sql, field in self.queries:
+            if field is not None:
+                fields[sql].add(field)
+        return [
+            (count, sorted(fields[sql]), sql)
+            for sql, count in counts.most_common()
+            if count >= threshold
+        ]
+
+    def exceeds(self, budget, threshold):
+        return self.count > budget or bool(self.duplicates(threshold))
+
+    def report(self, budget, threshold, title='block'):
+        lines = [
+            f'{title}: {self.count} queries '
+            f'({self.duration * 1000:.1f} ms), budget {budget}'
+        ]
+        for count, fields, sql in self.duplicates(threshold):
+            source = ', '.join(fields) or 'unknown field'
+            lines.append(f'  x{count} {source}: {sql}')
+        return '\n'.join(lines)
+
+
+@contextmanager
+def record_queries(using=DEFAULT_DB_ALIAS):
+    recorder = QueryRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+
+
+@contextmanager
+def query_budget(budget, threshold=None, using=DEFAULT_DB_ALIAS):
+    """Помощник для тестов: падает, если блок вышел за бюджет запросов.
+
+        with query_budget(6):
+            client.get('/api/recipes/')
+    """
+    threshold = threshold or settings.QUERY_BUDGET_REPEATS
+    with record_queries(using) as recorder:
+        yield recorder
+    if recorder.exceeds(budget, threshold):
+        raise QueryBudgetExceeded(recorder.report(budget, threshold))
+
+
+class QueryBudgetMiddleware:
+    """Считает запросы к БД на каждый HTTP-запрос.
+
+    Добавляет заголовок Server-Timing и пишет предупреждение, если
+    view превысило бюджет (атрибут query_budget у view или
+    QUERY_BUDGET; для изменяющих запросов write_query_budget или
+    QUERY_BUDGET_WRITE) или повторяет один и тот же запрос. При
+    QUERY_BUDGET_STRICT вместо предупреждения бросает исключение.
+    Подключается в settings только при QUERY_BUDGET_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        response['Server-Timing'] = ', '.join(filter(None, (
+            response.get('Server-Timing'),
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries"',
+        )))
+        budget = self.get_budget(request)
+        threshold = settings.QUERY_BUDGET_REPEATS
+        if recorder.exceeds(budget, threshold):
+            self.report(request, recorder, budget, threshold)
+        return response
+
+    @staticmethod
+    def get_budget(request):
+        view = getattr(request.resolver_match, 'func', None)
+        view = getattr(view, 'cls', view)
+        if request.method in SAFE_METHODS:
+            return getattr(view, 'query_budget', settings.QUERY_BUDGET)
+        return getattr(
+            view, 'write_query_budget', settings.QUERY_BUDGET_WRITE
+        )
+
+    @staticmethod
+    def report(request, recorder, budget, threshold):
+        title = f'{request.method} {request.path}'
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(
+                recorder.report(budget, threshold, title)
+            )
+        logger.warning(
+            'Query budget exceeded: %s', title,
+            extra={
+                'path': request.path,
+                'method': request.method,
+                'queries': recorder.count,
+                'duration_ms': round(recorder.duration * 1000, 1),
+                'budget': budget,
+                'duplicates': [
+                    {'count': count, 'fields': fields, 'sql': sql}
+                    for count, fields, sql in recorder.duplicates(threshold)
+                ],
+            }
+        )
@@ -0,0 +1,90 @@
+import json
+import re
+from uuid import uuid4
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if orjson is not None else 0
+)
+
+
+class Fragment:
+    """Готовый JSON, который вставляется в ответ без повторного кодирования."""
+
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+
+class FragmentEncoder(JSONEncoder):
+    """Кодировщик DRF, заменяющий фрагменты метками для последующей вставки.
+
+    Метка начинается с \\x00 и содержит случайный nonce, поэтому не может
+    совпасть с обычной строкой из данных.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fragments = []
+        self.nonce = None
+
+    def default(self, obj):
+        if not isinstance(obj, Fragment):
+            return super().default(obj)
+        if self.nonce is None:
+            self.nonce = uuid4().hex
+        self.fragments.append(obj.raw)
+        return f'\x00{self.nonce}:{len(self.fragments) - 1}'
+
+    def splice(self, content):
+        if not self.fragments:
+            return content
+        return re.sub(
+            rb'"\\u0000' + self.nonce.encode() + rb':(\d+)"',
+            lambda match: self.fragments[int(match[1])],
+            content
+        )
+
+
+def dumps(data, indent=None):
+    encoder = FragmentEncoder()
+    if orjson is not None and not indent:
+        content = orjson.dumps(
+            data, default=encoder.default, option=ORJSON_OPTIONS
+        )
+    else:
+        separators = (',', ':') if indent is None else None
+        content = json.dumps(
+            data, default=encoder.default, indent=indent,
+            ensure_ascii=not api_settings.UNICODE_JSON,
+            allow_nan=not api_settings.STRICT_JSON, separators=separators
+        ).encode()
+    # Как и JSONRenderer, экранируем разделители строк для встраивания в JS.
+    content = content.replace(
+        '\u2028'.encode(), b'\\u2028'
+    ).replace('\u2029'.encode(), b'\\u2029')
+    return encoder.splice(content)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с поддержкой Fragment.
+
+    Без orjson или с отступами (browsable API) кодирует стандартным json.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data, self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ))
@@ -0,0 +1,113 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, When
+
+from recipes.models import SEARCH_CONFIG, IngredientInRecipe, Recipe
+
+WORD_RE = re.compile(r'\w+')
+NAME_WEIGHT = 1.0
+INGREDIENT_WEIGHT = 0.4
+TEXT_WEIGHT = 0.2
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+
+class RecipeSearchIndex:
+    """Инвертированный индекс рецептов в памяти процесса.
+
+    Используется вместо tsvector, когда база данных не PostgreSQL.
+    Слова запроса сопоставляются с началом слов индекса, что грубо
+    заменяет стемминг.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._lock = Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    @staticmethod
+    def _build():
+        postings = defaultdict(lambda: defaultdict(float))
+        for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            for token in tokenize(name):
+                postings[token][recipe_id] += NAME_WEIGHT
+            for token in tokenize(text):
+                postings[token][recipe_id] += TEXT_WEIGHT
+        for recipe_id, name in IngredientInRecipe.objects.values_list(
+            'recipe', 'ingredient__name'
+        ).iterator():
+            for token in tokenize(name):
+                postings[token][recipe_id] += INGREDIENT_WEIGHT
+        tokens = sorted(postings)
+        return tokens, [dict(postings[token]) for token in tokens]
+
+    def _load(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._build()
+            return self._index
+
+    def search(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        tokens, postings = self._load()
+        scores = None
+        for term in terms:
+            start = bisect_left(tokens, term)
+            end = bisect_left(tokens, term + '\uffff', start)
+            term_scores = defaultdict(float)
+            for position in range(start, end):
+                for recipe_id, weight in postings[position].items():
+                    term_scores[recipe_id] += weight
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    recipe_id: score + term_scores[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in term_scores
+                }
+        return sorted(
+            scores, key=lambda recipe_id: (-scores[recipe_id], -recipe_id)
+        )
+
+
+search_index = RecipeSearchIndex()
+
+
+def refresh_search(recipes):
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk__in=recipes).update_search_vector()
+    else:
+        search_index.invalidate()
+
+
+def search_recipes(queryset, query):
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='plain'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-id')
+    recipe_ids = search_index.search(query)
+    if not recipe_ids:
+        return queryset.none()
+    return queryset.filter(pk__in=recipe_ids).order_by(Case(
+        *(When(pk=pk, then=position)
+          for position, pk in enumerate(recipe_ids)),
+        output_field=IntegerField(),
+    ))
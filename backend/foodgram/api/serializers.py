@@ -1,14 +1,19 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                             ShoppingCart, Tag)
+from recipes.signals import recipe_ingredients_changed
 from users.models import Subscription
+from .fields import ThumbnailImageField
 
 User = get_user_model()
 
+BULK_MAX_RECIPES = 100
+
 
 class UserCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -49,6 +54,8 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -77,7 +84,9 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Ингредиенты всего рецепта загружаются одним запросом
+    # в RecipeSerializer.validate_ingredients.
+    id = serializers.IntegerField()
 
     class Meta:
         model = IngredientInRecipe
@@ -113,7 +122,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
-    image = Base64ImageField()
+    image = ThumbnailImageField(variant='detail')
 
     class Meta:
         model = Recipe
@@ -131,6 +140,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -139,6 +150,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -186,12 +199,59 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         self.add_ingredients(ingredients, recipe)
         recipe.tags.set(tags)
+        recipe_ingredients_changed.send(
+            sender=self.__class__,
+            recipe_ids=[recipe.pk],
+            ingredient_ids=[ingredient['id'].id for ingredient in ingredients]
+        )
         return recipe
 
+    @staticmethod
+    def update_ingredients(ingredients, recipe):
+        existing = {
+            item.ingredient_id: item
+            for item in recipe.ingredient_in_recipe.all()
+        }
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = existing.keys() - amounts.keys()
+        added = amounts.keys() - existing.keys()
+        updated = [
+            item for ingredient_id, item in existing.items()
+            if ingredient_id in amounts
+            and item.amount != amounts[ingredient_id]
+        ]
+        for item in updated:
+            item.amount = amounts[item.ingredient_id]
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient__in=removed
+            ).delete()
+        if updated:
+            IngredientInRecipe.objects.bulk_update(updated, ('amount',))
+        if added:
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    ingredient_id=ingredient_id,
+                    recipe=recipe,
+                    amount=amounts[ingredient_id]
+                )
+                for ingredient_id in added
+            )
+        return removed | added | {item.ingredient_id for item in updated}
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
         ingredients = validated_data.pop('ingredients')
-        IngredientInRecipe.objects.filter(recipe=recipe).delete()
-        self.add_ingredients(ingredients, recipe)
+        changed = self.update_ingredients(ingredients, recipe)
+        if changed:
+            recipe_ingredients_changed.send(
+                sender=self.__class__,
+                recipe_ids=[recipe.pk],
+                ingredient_ids=changed
+            )
         if 'tags' in self.validated_data:
             recipe.tags.set(validated_data.pop('tags'))
         return super().update(recipe, validated_data)
@@ -199,8 +259,22 @@ class RecipeSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.for_user(request.user).get(pk=instance.pk)
         return RecipeReadSerializer(instance, context=context).data
 
+    def validate_ingredients(self, ingredients):
+        found = Ingredient.objects.in_bulk(
+            ingredient['id'] for ingredient in ingredients
+        )
+        for ingredient in ingredients:
+            if ingredient['id'] not in found:
+                raise serializers.ValidationError(
+                    f'Недопустимый первичный ключ "{ingredient["id"]}" - '
+                    'объект не существует.'
+                )
+            ingredient['id'] = found[ingredient['id']]
+        return ingredients
+
     def validate(self, data):
         ingredients = data['ingredients']
         ing_list = [ingredient['id'] for ingredient in ingredients]
@@ -212,7 +286,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = ThumbnailImageField(variant='card')
 
     class Meta:
         model = Recipe
@@ -224,6 +298,17 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         )
 
 
+class BulkRecipeSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_RECIPES,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class SubscriptionSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
@@ -244,13 +329,13 @@ class SubscriptionSerializer(UserSerializer):
 
     @staticmethod
     def get_recipes_count(obj):
-        return obj.recipe.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         limit = request.GET.get('recipes_limit')
         recipes = obj.recipe.all()
-        if limit:
+        if limit and limit.isdigit():
             recipes = recipes[:int(limit)]
         serializer = ShortRecipeSerializer(recipes, many=True, read_only=True)
         return serializer.data
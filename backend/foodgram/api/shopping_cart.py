@@ -0,0 +1,96 @@
+import csv
+import logging
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen import canvas
+
+TITLE = 'Список покупок'
+FONT_NAME = 'Arial'
+FALLBACK_FONT_NAME = 'Helvetica'
+FONT_SIZE = 12
+TITLE_FONT_SIZE = 16
+LINE_HEIGHT = 18
+MARGIN = 50
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_font_name():
+    """Регистрирует шрифт один раз на процесс."""
+    try:
+        pdfmetrics.registerFont(
+            TTFont(FONT_NAME, settings.SHOPPING_CART_FONT)
+        )
+    except (OSError, TTFError) as error:
+        logger.warning(
+            'Шрифт %s не загружен (%s), PDF будет без кириллицы: %s',
+            settings.SHOPPING_CART_FONT, error, FALLBACK_FONT_NAME
+        )
+        return FALLBACK_FONT_NAME
+    return FONT_NAME
+
+
+def format_line(row):
+    return f'{row["name"]} ({row["measurement_unit"]}) - {row["total"]}'
+
+
+def render_txt(rows):
+    yield f'{TITLE}\n'.encode()
+    for row in rows:
+        yield f'- {format_line(row)}\n'.encode()
+
+
+class Echo:
+    """Буфер для csv.writer, который отдаёт строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'total')).encode()
+    for row in rows:
+        yield writer.writerow((
+            row['name'], row['measurement_unit'], row['total']
+        )).encode()
+
+
+def render_pdf(rows):
+    """Собирает PDF в памяти и отдаёт его одним куском.
+
+    ReportLab пишет объекты страниц и таблицу ссылок только в save(),
+    поэтому PDF, в отличие от CSV и TXT, не отдаётся постранично. Размер
+    ограничен числом разных ингредиентов в сводном списке, а не числом
+    рецептов в корзине.
+    """
+    font_name = get_font_name()
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    width, height = A4
+    pdf.setFont(font_name, TITLE_FONT_SIZE)
+    pdf.drawString(MARGIN, height - MARGIN, TITLE)
+    y = height - MARGIN - LINE_HEIGHT * 2
+    pdf.setFont(font_name, FONT_SIZE)
+    for row in rows:
+        if y < MARGIN:
+            pdf.showPage()
+            pdf.setFont(font_name, FONT_SIZE)
+            y = height - MARGIN
+        pdf.drawString(MARGIN, y, f'• {format_line(row)}')
+        y -= LINE_HEIGHT
+    pdf.save()
+    yield buffer.getvalue()
+
+
+FORMATS = {
+    'pdf': ('application/pdf', render_pdf),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'txt': ('text/plain; charset=utf-8', render_txt),
+}
@@ -0,0 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.images import thumbnails_ready
+from recipes.signals import ingredients_loaded, recipe_ingredients_changed
+from .authentication import token_cache
+from .autocomplete import prefix_index
+from .caching import invalidate_on_commit
+from .compiled import forget_all, forget_authors, forget_recipes
+from .matcher import matcher
+from .search import refresh_search
+
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver(ingredients_loaded)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(prefix_index.invalidate)
+    invalidate_on_commit('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_recipe_representations(**kwargs):
+    forget_all()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    invalidate_on_commit('tags')
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_search(instance, **kwargs):
+    refresh_search([instance.pk])
+    forget_recipes([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe(instance, **kwargs):
+    recipe_ids = [instance.pk]
+    refresh_search(recipe_ids)
+    transaction.on_commit(lambda: matcher.update_recipes(recipe_ids))
+    forget_recipes(recipe_ids)
+
+
+@receiver(recipe_ingredients_changed)
+def refresh_recipe_ingredients(recipe_ids, **kwargs):
+    refresh_search(recipe_ids)
+    # Индекс читает строки заново: до коммита он увидел бы старый
+    # состав или, в другом процессе, поднятую раньше времени версию.
+    transaction.on_commit(lambda: matcher.update_recipes(recipe_ids))
+    forget_recipes(recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def forget_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        forget_recipes([instance.pk])
+    elif pk_set is not None:
+        forget_recipes(pk_set)
+    else:
+        forget_all()
+
+
+@receiver(thumbnails_ready)
+def forget_recipe_images(name, **kwargs):
+    forget_recipes(Recipe.objects.filter(image=name).values_list(
+        'id', flat=True
+    ))
+
+
+@receiver(post_save, sender=User)
+def forget_author(instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        forget_authors([instance.pk])
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(**kwargs):
+    token_cache.invalidate()
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(created, update_fields=None, **kwargs):
+    """Смена пароля, деактивация и правка профиля сбрасывают кэш токенов."""
+    if created:
+        return
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        token_cache.invalidate()
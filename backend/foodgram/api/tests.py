@@ -0,0 +1,1704 @@
+import json
+import os
+import re
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.http import QueryDict
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from recipes.admin import IngredientInRecipeAdmin
+from recipes.images import thumbnail_name, thumbnails_ready
+from recipes.management.commands.load_ingredients import (DEFAULT_PATH,
+                                                          read_csv, read_json)
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, RecipeRanking,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.units import normalize
+from users.models import Subscription
+from .autocomplete import MAX_LIMIT, prefix_index
+from .compiled import recipe_key, recipe_rows, serialize_recipes
+from .filters import RecipeFilter
+from .query_budget import (QueryBudgetExceeded, field_label, fingerprint,
+                           query_budget)
+from .renderers import Fragment, ORJSONRenderer, dumps
+from .search import search_index, search_recipes
+from .serializers import RecipeReadSerializer
+
+User = get_user_model()
+
+RECIPES_URL = '/api/recipes/'
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+    'AAAADElEQVR4nGP4//8/AAX+Av4N70a4AAAAAElFTkSuQmCC'
+)
+INGREDIENT_WRITE = re.compile(
+    r'(?:INSERT INTO|UPDATE|DELETE FROM) "recipe_recipe_ingredient"'
+)
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов на страницу списка рецептов не зависит от её размера.
+
+    Холодный запрос собирает представления рецептов и авторов в кэш,
+    тёплый берёт их оттуда.
+    """
+
+    page_sizes = (6, 50)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Тестов', password='pass'
+        )
+        authors = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}', first_name='Автор',
+                last_name=str(number), password='pass'
+            )
+            for number in range(5)
+        ]
+        tags = [
+            Tag.objects.create(name=slug, color='#E26C2D', slug=slug)
+            for slug in ('breakfast', 'lunch', 'dinner')
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(10)
+        ]
+        recipes = [
+            Recipe.objects.create(
+                author=authors[number % len(authors)],
+                image=f'recipe/{number}.png',
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+            )
+            for number in range(60)
+        ]
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for number, recipe in enumerate(recipes)
+            for tag in tags[:number % len(tags) + 1]
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                amount=100,
+            )
+            for number, recipe in enumerate(recipes)
+            for shift in range(3)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::2]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in recipes[::3]
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=cls.user, author=author)
+            for author in authors[:2]
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_constant_queries(self, cold, warm):
+        for size in self.page_sizes:
+            cache.clear()
+            with self.subTest(size=size):
+                with self.assertNumQueries(cold):
+                    response = self.client.get(RECIPES_URL, {'limit': size})
+                self.assertEqual(len(response.data['results']), size)
+                with self.assertNumQueries(warm):
+                    self.client.get(RECIPES_URL, {'limit': size})
+
+    def test_anonymous(self):
+        self.assert_constant_queries(cold=7, warm=2)
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_constant_queries(cold=8, warm=3)
+
+    def test_detail(self):
+        recipe = Recipe.objects.first()
+        response = self.client.get(f'{RECIPES_URL}{recipe.pk}/')
+        self.assertEqual(response.data['id'], recipe.pk)
+        for pk in ('abc', 10 ** 6):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'{RECIPES_URL}{pk}/')
+                self.assertEqual(response.status_code, 404)
+
+    def test_authenticated_flags(self):
+        self.client.force_authenticate(self.user)
+        recipes = self.client.get(RECIPES_URL, {'limit': 50}).data['results']
+        favorited = set(
+            Favorite.objects.filter(user=self.user).values_list(
+                'recipe', flat=True
+            )
+        )
+        in_cart = set(
+            ShoppingCart.objects.filter(user=self.user).values_list(
+                'recipe', flat=True
+            )
+        )
+        subscribed = set(
+            Subscription.objects.filter(user=self.user).values_list(
+                'author', flat=True
+            )
+        )
+        for recipe in recipes:
+            self.assertEqual(recipe['is_favorited'], recipe['id'] in favorited)
+            self.assertEqual(
+                recipe['is_in_shopping_cart'], recipe['id'] in in_cart
+            )
+            self.assertEqual(
+                recipe['author']['is_subscribed'],
+                recipe['author']['id'] in subscribed
+            )
+
+
+class CountersTest(APITestCase):
+    """Полное сохранение объекта не затирает счётчики из сигналов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='pass'
+            )
+            for name in ('author', 'reader')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, image='recipe/1.png', name='Рецепт',
+            text='Описание', cooking_time=10
+        )
+
+    def test_save_keeps_counters(self):
+        author = User.objects.get(pk=self.author.pk)
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Subscription.objects.create(user=self.reader, author=self.author)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        author.first_name = 'Автор'
+        author.save()
+        recipe.name = 'Новое название'
+        recipe.save()
+        self.author.refresh_from_db()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.author.first_name, 'Автор')
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+
+class ShoppingListTest(APITestCase):
+    """Сводный список покупок совпадает с суммой по корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer',
+            first_name='buyer', last_name='buyer', password='pass'
+        )
+        cls.flour, cls.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, image='recipe/1.png', name='Рецепт',
+            text='Описание', cooking_time=10
+        )
+        cls.item = IngredientInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.flour, amount=100
+        )
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def assert_matches_cart(self):
+        totals = IngredientInRecipe.objects.filter(
+            recipe__shopping_cart__user=self.user
+        ).values('ingredient').annotate(total=Sum('amount'))
+        self.assertEqual(
+            {row['ingredient']: row['total'] for row in totals},
+            dict(ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient', 'amount'
+            ))
+        )
+
+    def setUp(self):
+        self.admin = IngredientInRecipeAdmin(IngredientInRecipe, admin.site)
+        self.client.force_authenticate(self.user)
+
+    def test_ingredient_in_recipe_saved(self):
+        self.item.amount = 999
+        self.admin.save_model(None, self.item, None, change=True)
+        self.assert_matches_cart()
+        self.item.ingredient = self.sugar
+        self.admin.save_model(None, self.item, None, change=True)
+        self.assert_matches_cart()
+
+    def test_ingredient_in_recipe_deleted(self):
+        self.admin.save_model(None, IngredientInRecipe(
+            recipe=self.recipe, ingredient=self.sugar, amount=50
+        ), None, change=False)
+        self.assert_matches_cart()
+        self.admin.delete_model(None, self.item)
+        self.assert_matches_cart()
+        self.admin.delete_queryset(
+            None, IngredientInRecipe.objects.filter(recipe=self.recipe)
+        )
+        self.assert_matches_cart()
+
+    def test_totals_normalized(self):
+        kilo = Ingredient.objects.create(name='мука', measurement_unit='кг')
+        recipe = Recipe.objects.create(
+            author=self.user, image='recipe/1.png', name='Пирог',
+            text='Описание', cooking_time=10
+        )
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient=kilo, amount=2
+        )
+        self.client.post(f'{RECIPES_URL}{recipe.pk}/shopping_cart/')
+        response = self.client.get(f'{RECIPES_URL}shopping_cart_totals/')
+        self.assertEqual(response.data, [
+            {'name': 'мука', 'measurement_unit': 'кг', 'amount': 2.1},
+        ])
+
+    def test_ingredient_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.flour.delete()
+        self.assertTrue(callbacks)
+        self.assert_matches_cart()
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    """Выгрузка списка покупок повторяет итоги корзины."""
+
+    url = f'{RECIPES_URL}download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='export@example.com', username='export',
+            first_name='export', last_name='export', password='pass'
+        )
+        flour, sugar, milk, milk_litres = (
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (
+                ('мука', 'г'), ('сахар', 'г'), ('молоко', 'мл'),
+                ('молоко', 'л'),
+            )
+        )
+        for name, ingredients in (
+            ('Блины', [(flour, 100), (milk, 500), (sugar, 50)]),
+            ('Оладьи', [(flour, 200), (milk_litres, 1)]),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.user, image='recipe/1.png', name=name,
+                text='Описание', cooking_time=10
+            )
+            for ingredient, amount in ingredients:
+                IngredientInRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_type):
+        response = self.client.get(self.url, {'type': file_type})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping.{file_type}"'
+        )
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, body = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(body.decode(), (
+            'name,measurement_unit,total\r\n'
+            'молоко,л,1.5\r\n'
+            'мука,г,300\r\n'
+            'сахар,г,50\r\n'
+        ))
+
+    def test_txt(self):
+        response, body = self.download('txt')
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
+        self.assertEqual(body.decode(), (
+            'Список покупок\n'
+            '- молоко (л) - 1.5\n'
+            '- мука (г) - 300\n'
+            '- сахар (г) - 50\n'
+        ))
+
+    def test_pdf(self):
+        response, body = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(body.startswith(b'%PDF'))
+
+    def test_matches_totals(self):
+        totals = self.client.get(f'{RECIPES_URL}shopping_cart_totals/')
+        _, body = self.download('csv')
+        rows = body.decode().splitlines()[1:]
+        self.assertEqual(rows, [
+            f'{row["name"]},{row["measurement_unit"]},{row["amount"]}'
+            for row in totals.data
+        ])
+
+    def test_empty_cart(self):
+        for recipe in Recipe.objects.filter(author=self.user):
+            self.client.delete(f'{RECIPES_URL}{recipe.pk}/shopping_cart/')
+        _, body = self.download('txt')
+        self.assertEqual(body.decode(), 'Список покупок\n')
+
+    def test_unknown_type_rejected(self):
+        response = self.client.get(self.url, {'type': 'docx'})
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryBudgetTest(APITestCase):
+    """Счётчик запросов находит лишние и повторяющиеся запросы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='budget@example.com', username='budget',
+            first_name='budget', last_name='budget', password='pass'
+        )
+        tag = Tag.objects.create(name='Обед', color='#E26C2D', slug='lunch')
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=author, image='recipe/1.png', name=f'Рецепт {number}',
+                text='Описание', cooking_time=10
+            )
+            recipe.tags.add(tag)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT 1 WHERE id IN (%s, %s,%s) AND a = %s'),
+            'SELECT 1 WHERE id IN (%s, ...) AND a = %s'
+        )
+
+    def test_within_budget(self):
+        with query_budget(2) as recorder:
+            list(Recipe.objects.all())
+        self.assertEqual(recorder.count, 1)
+
+    def test_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(1):
+                list(Recipe.objects.all())
+                list(Tag.objects.all())
+
+    def test_repeats_reported_with_field(self):
+        recipes = Recipe.objects.select_related('author')
+        request = APIRequestFactory().get(RECIPES_URL)
+        request.user = AnonymousUser()
+        with self.assertRaisesMessage(
+            QueryBudgetExceeded, 'x3 RecipeReadSerializer.tags'
+        ):
+            with query_budget(10, threshold=3):
+                RecipeReadSerializer(
+                    recipes, many=True, context={'request': request}
+                ).data
+
+    def test_field_label_outside_serializer(self):
+        self.assertIsNone(field_label())
+
+    def test_middleware(self):
+        response = self.client.get(RECIPES_URL)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        with override_settings(QUERY_BUDGET=1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(RECIPES_URL)
+            with override_settings(QUERY_BUDGET_STRICT=False):
+                with self.assertLogs('api.query_budget', 'WARNING'):
+                    self.client.get(RECIPES_URL)
+
+
+class LoadIngredientsTest(APITestCase):
+    """Загрузка ингредиентов из файла повторяема и не зависит от формата."""
+
+    rows = [
+        ('мука', 'г'), ('молоко', 'мл'), ('яйца', 'шт.'), ('мука', 'г'),
+    ]
+
+    def write(self, suffix, content):
+        file = tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, encoding='utf-8', delete=False
+        )
+        with file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def write_csv(self):
+        return self.write('.csv', ''.join(
+            f'{name},{unit}\n' for name, unit in self.rows
+        ))
+
+    def write_json(self):
+        return self.write('.json', json.dumps([
+            {'name': name, 'measurement_unit': unit}
+            for name, unit in self.rows
+        ]))
+
+    def test_readers_agree(self):
+        self.assertEqual(
+            list(read_csv(self.write_csv())),
+            list(read_json(self.write_json()))
+        )
+
+    def test_default_file_shipped(self):
+        self.assertTrue(os.path.exists(DEFAULT_PATH))
+
+    def test_rerun_inserts_nothing(self):
+        out = StringIO()
+        call_command('load_ingredients', self.write_csv(), stdout=out)
+        self.assertEqual(Ingredient.objects.count(), 3)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('load_ingredients', self.write_json(), stdout=out)
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith(('INSERT', 'COPY'))
+        ])
+        self.assertEqual(Ingredient.objects.count(), 3)
+        self.assertIn('Добавлено 0, пропущено 4', out.getvalue())
+
+
+class AutocompleteTest(APITestCase):
+    """Подсказки ищут по началу названия: короче — выше, затем по алфавиту."""
+
+    url = '/api/ingredients/autocomplete/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in (
+            'сахарная пудра', 'сахар', 'соль', 'сало', 'сахарин', 'масло'
+        ):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        prefix_index.invalidate()
+        self.addCleanup(prefix_index.invalidate)
+
+    def names(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data]
+
+    def test_prefix_ordering(self):
+        self.assertEqual(
+            self.names(name='СА'),
+            ['сало', 'сахар', 'сахарин', 'сахарная пудра']
+        )
+        self.assertEqual(self.names(name='сахар'), [
+            'сахар', 'сахарин', 'сахарная пудра'
+        ])
+        self.assertEqual(self.names(name='ло'), [])
+
+    def test_limit(self):
+        self.assertEqual(self.names(name='с', limit=2), ['сало', 'соль'])
+        self.assertEqual(self.names(name='с', limit=0), ['сало'])
+        self.assertEqual(len(self.names(limit=MAX_LIMIT + 1)), 6)
+        response = self.client.get(self.url, {'name': 'с', 'limit': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_ingredient_found_after_commit(self):
+        self.assertEqual(self.names(name='соль'), ['соль'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name='соль морская', measurement_unit='г'
+            )
+        self.assertEqual(self.names(name='соль'), ['соль', 'соль морская'])
+
+
+class UnitsTest(SimpleTestCase):
+    """Сведение строк списка покупок к общим единицам."""
+
+    def normalize(self, *rows):
+        return list(normalize(
+            {'name': name, 'measurement_unit': unit, 'total': total}
+            for name, unit, total in rows
+        ))
+
+    def test_converted_to_base_unit(self):
+        self.assertEqual(
+            self.normalize(('мука', 'г', 500), ('мука', 'кг', 1)),
+            [{'name': 'мука', 'measurement_unit': 'кг', 'total': 1.5}]
+        )
+        self.assertEqual(
+            self.normalize(('молоко', 'ст. л.', 2), ('молоко', 'мл', 20)),
+            [{'name': 'молоко', 'measurement_unit': 'мл', 'total': 50}]
+        )
+
+    def test_unconvertible_units_kept(self):
+        self.assertEqual(
+            self.normalize(
+                ('соль', 'г', 5), ('соль', 'по  вкусу', 1),
+                ('соль', 'по вкусу', 1),
+            ),
+            [
+                {'name': 'соль', 'measurement_unit': 'г', 'total': 5},
+                {'name': 'соль', 'measurement_unit': 'по вкусу', 'total': 2},
+            ]
+        )
+
+    def test_grouped_by_name(self):
+        self.assertEqual(
+            [
+                (row['name'], row['total'])
+                for row in self.normalize(
+                    ('мука', 'г', 100), ('сахар', 'г', 50),
+                    ('сахар', 'г', 25),
+                )
+            ],
+            [('мука', 100), ('сахар', 75)]
+        )
+
+
+class TagFilterTest(APITestCase):
+    """Несколько тегов объединяются через ИЛИ и не дублируют рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='tags@example.com', username='tags',
+            first_name='tags', last_name='tags', password='pass'
+        )
+        breakfast, lunch, dinner = (
+            Tag.objects.create(name=slug, color='#E26C2D', slug=slug)
+            for slug in ('breakfast', 'lunch', 'dinner')
+        )
+        cls.recipes = {}
+        for name, tags in (
+            ('Каша', [breakfast]),
+            ('Суп', [lunch]),
+            ('Омлет', [breakfast, lunch]),
+            ('Рагу', [dinner]),
+            ('Хлеб', []),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, image='recipe/1.png', name=name,
+                text='Описание', cooking_time=10
+            )
+            recipe.tags.set(tags)
+            cls.recipes[name] = recipe.pk
+
+    def setUp(self):
+        cache.clear()
+
+    def filtered(self, *tags):
+        response = self.client.get(RECIPES_URL, {'tags': tags})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(response.data['results']))
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def ids(self, *names):
+        return sorted((self.recipes[name] for name in names), reverse=True)
+
+    def test_single_tag(self):
+        self.assertEqual(self.filtered('breakfast'), self.ids('Каша', 'Омлет'))
+
+    def test_any_of_several_tags(self):
+        self.assertEqual(
+            self.filtered('breakfast', 'lunch'),
+            self.ids('Каша', 'Суп', 'Омлет')
+        )
+        self.assertEqual(
+            self.filtered('breakfast', 'lunch', 'dinner'),
+            self.ids('Каша', 'Суп', 'Омлет', 'Рагу')
+        )
+
+    def test_unknown_tag_rejected(self):
+        response = self.client.get(RECIPES_URL, {'tags': ['brunch']})
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(
+    connection.vendor == 'postgresql', 'План запроса проверяется на PostgreSQL'
+)
+class RecipeFilterPlanTest(APITestCase):
+    """Флаги пользователя проверяются по индексам уникальных ограничений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='planner@example.com', username='planner',
+            first_name='planner', last_name='planner', password='pass'
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        recipe = Recipe.objects.create(
+            author=cls.user, image='recipe/1.png', name='Рецепт',
+            text='Описание', cooking_time=10
+        )
+        recipe.tags.add(cls.tag)
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def explain(self, query, *disabled):
+        request = APIRequestFactory().get(RECIPES_URL)
+        request.user = self.user
+        queryset = RecipeFilter(
+            QueryDict(query), Recipe.objects.for_user(self.user),
+            request=request
+        ).qs
+        with connection.cursor() as cursor:
+            # На паре строк планировщик выбрал бы Seq Scan; проверяем,
+            # что подходящий индекс вообще применим.
+            for setting in ('enable_seqscan', *disabled):
+                cursor.execute(f'SET LOCAL {setting} = off')
+        return queryset[:6].explain()
+
+    def test_flags_use_unique_indexes(self):
+        plan = self.explain(
+            f'is_favorited=1&is_in_shopping_cart=1'
+            f'&tags={self.tag.slug}&author={self.user.pk}'
+        )
+        self.assertIn('unique_favorite', plan)
+        self.assertIn('unique_shopping_cart', plan)
+
+    def test_ordering_uses_ranking_index(self):
+        for value, index in (
+            ('popular', 'ranking_popularity_idx'),
+            ('trending', 'ranking_trending_idx'),
+        ):
+            with self.subTest(value):
+                self.assertIn(
+                    index, self.explain(f'ordering={value}', 'enable_sort')
+                )
+
+
+class RankingTest(APITestCase):
+    """Сортировка по рейтингу видит все рецепты и идёт через INNER JOIN."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='ranking@example.com', username='ranking',
+            first_name='ranking', last_name='ranking', password='pass'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, image='recipe/1.png', name=f'Рецепт {number}',
+                text='Описание', cooking_time=10
+            )
+            for number in range(3)
+        ]
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def ordered(self, value):
+        response = self.client.get(RECIPES_URL, {'ordering': value})
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_every_recipe_ranked(self):
+        self.assertEqual(RecipeRanking.objects.count(), 3)
+        call_command('update_rankings', stdout=StringIO())
+        popularity = dict(
+            RecipeRanking.objects.values_list('recipe', 'popularity')
+        )
+        self.assertAlmostEqual(popularity.pop(self.recipes[0].pk), 1.0)
+        self.assertEqual(popularity, {
+            self.recipes[1].pk: 0, self.recipes[2].pk: 0,
+        })
+
+    def test_popular_first_then_newest(self):
+        call_command('update_rankings', stdout=StringIO())
+        for value in ('popular', 'trending'):
+            self.assertEqual(self.ordered(value), [
+                self.recipes[0].pk, self.recipes[2].pk, self.recipes[1].pk,
+            ])
+
+    def test_inner_join_without_nulls_last(self):
+        sql = str(RecipeFilter(
+            QueryDict('ordering=popular'), Recipe.objects.all()
+        ).qs.query)
+        self.assertIn('INNER JOIN "recipes_reciperanking"', sql)
+        self.assertNotIn('NULLS LAST', sql)
+
+
+class InteractionBackfillTest(TransactionTestCase):
+    """Миграции 0013-0014 датируют старые строки и создают рейтинги."""
+
+    before = [('recipes', '0012_feedentry')]
+    after = [('recipes', '0014_ranking_rows_and_indexes')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_backfilled_from_date_joined(self):
+        apps = self.migrate(self.before)
+        joined = timezone.now() - timedelta(days=400)
+        user = apps.get_model('users', 'User').objects.create(
+            email='old@example.com', username='old', first_name='old',
+            last_name='old', date_joined=joined
+        )
+        recipe = apps.get_model('recipes', 'Recipe').objects.create(
+            author=user, image='recipe/1.png', name='Рецепт',
+            text='Описание', cooking_time=10
+        )
+        for name in ('Favorite', 'ShoppingCart'):
+            apps.get_model('recipes', name).objects.create(
+                user=user, recipe=recipe
+            )
+        apps = self.migrate(self.after)
+        for name in ('Favorite', 'ShoppingCart'):
+            self.assertEqual(
+                apps.get_model('recipes', name).objects.get().created, joined
+            )
+        ranking = apps.get_model('recipes', 'RecipeRanking').objects.get()
+        self.assertEqual(
+            (ranking.recipe_id, ranking.popularity), (recipe.pk, 0)
+        )
+
+
+class CursorPaginationTest(APITestCase):
+    """Курсорный режим не подменяет явную сортировку порядком по id."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='cursor@example.com', username='cursor',
+            first_name='cursor', last_name='cursor', password='pass'
+        )
+        for number in range(3):
+            Recipe.objects.create(
+                author=author, image='recipe/1.png', name=f'Суп {number}',
+                text='Описание', cooking_time=10
+            )
+
+    def test_default_ordering(self):
+        response = self.client.get(RECIPES_URL, {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_explicit_ordering_rejected(self):
+        for params in ({'ordering': 'popular'}, {'search': 'суп'}):
+            with self.subTest(**params):
+                response = self.client.get(
+                    RECIPES_URL, {**params, 'pagination': 'cursor'}
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('pagination', response.data)
+
+
+class SubscriptionsTest(APITestCase):
+    """Последние рецепты авторов в подписках без запросов на автора."""
+
+    url = '/api/users/subscriptions/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            email='follower@example.com', username='follower',
+            first_name='follower', last_name='follower', password='pass'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                email=f'writer{number}@example.com',
+                username=f'writer{number}', first_name='writer',
+                last_name=str(number), password='pass'
+            )
+            for number in range(5)
+        ]
+        cls.recipes = {
+            author.pk: [
+                Recipe.objects.create(
+                    author=author, image='recipe/1.png', name=f'Рецепт {n}',
+                    text='Описание', cooking_time=10
+                ).pk
+                for n in range(4)
+            ]
+            for author in cls.authors
+        }
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self, authors):
+        Subscription.objects.bulk_create(
+            Subscription(user=self.reader, author=author)
+            for author in authors
+        )
+
+    def subscriptions(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_latest_per_author(self):
+        self.assertEqual(
+            sorted(Recipe.objects.latest_per_author(2).values_list(
+                'id', flat=True
+            )),
+            sorted(
+                recipe_id for recipes in self.recipes.values()
+                for recipe_id in recipes[-2:]
+            )
+        )
+
+    def test_recipes_limit(self):
+        self.subscribe(self.authors[:2])
+        for author in self.subscriptions(recipes_limit=2):
+            with self.subTest(author=author['id']):
+                self.assertEqual(
+                    [recipe['id'] for recipe in author['recipes']],
+                    self.recipes[author['id']][:-3:-1]
+                )
+                self.assertEqual(author['recipes_count'], 4)
+
+    def test_invalid_limit_returns_all_recipes(self):
+        self.subscribe(self.authors[:2])
+        for limit in ('abc', '-1', ''):
+            with self.subTest(limit=limit):
+                for author in self.subscriptions(recipes_limit=limit):
+                    self.assertEqual(len(author['recipes']), 4)
+
+    def test_constant_queries(self):
+        counts = []
+        for authors in (self.authors[:1], self.authors[1:]):
+            self.subscribe(authors)
+            with CaptureQueriesContext(connection) as queries:
+                results = self.subscriptions(recipes_limit=3)
+            self.assertTrue(all(
+                len(author['recipes']) == 3 for author in results
+            ))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SearchTest(APITestCase):
+    """Индекс в памяти ранжирует рецепты так же, как tsvector.
+
+    Формы слов подобраны так, что стемминг и поиск по началу слова
+    находят одно и то же.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='search@example.com', username='search',
+            first_name='search', last_name='search', password='pass'
+        )
+        mushrooms = Ingredient.objects.create(
+            name='грибы', measurement_unit='г'
+        )
+        cls.recipes = {}
+        for name, text, ingredients in (
+            ('Суп с грибами', 'Варить час', []),
+            ('Рагу', 'Тушить овощи', [mushrooms]),
+            ('Омлет', 'Подавать с грибами', []),
+            ('Каша', 'Варить на молоке', []),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, image='recipe/1.png', name=name, text=text,
+                cooking_time=10
+            )
+            for ingredient in ingredients:
+                IngredientInRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+            cls.recipes[name] = recipe.pk
+        Recipe.objects.update_search_vector()
+
+    def setUp(self):
+        search_index.invalidate()
+        self.addCleanup(search_index.invalidate)
+
+    def search(self, query):
+        response = self.client.get(RECIPES_URL, {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def ids(self, *names):
+        return [self.recipes[name] for name in names]
+
+    def test_ranked_by_field_weight(self):
+        self.assertEqual(
+            self.search('гриб'), self.ids('Суп с грибами', 'Рагу', 'Омлет')
+        )
+
+    def test_all_words_required(self):
+        self.assertEqual(self.search('варить грибами'),
+                         self.ids('Суп с грибами'))
+        # При равном весе новые рецепты выше, как и при сортировке по rank.
+        self.assertEqual(self.search('варить'),
+                         self.ids('Каша', 'Суп с грибами'))
+        self.assertEqual(self.search('пицца'), [])
+
+    @skipUnless(
+        connection.vendor == 'postgresql', 'tsvector есть только в PostgreSQL'
+    )
+    def test_fallback_matches_tsvector(self):
+        for query in ('гриб', 'грибами', 'варить', 'варить грибами',
+                      'омлет', 'пицца'):
+            with self.subTest(query):
+                self.assertEqual(
+                    search_index.search(query),
+                    list(search_recipes(
+                        Recipe.objects.all(), query
+                    ).values_list('id', flat=True))
+                )
+
+
+class UserRecipesTest(APITestCase):
+    """Избранное и корзина поддерживают счётчики и список покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='pass'
+            )
+            for name in ('owner', 'other')
+        )
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.other, image='recipe/1.png', name=f'Хлеб {number}',
+                text='Описание', cooking_time=10
+            )
+            for number in range(3)
+        ]
+        for recipe in cls.recipes:
+            IngredientInRecipe.objects.create(
+                recipe=recipe, ingredient=flour, amount=100
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def url(self, recipe, action):
+        return f'{RECIPES_URL}{recipe.pk}/{action}/'
+
+    def favorites_count(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.favorites_count
+
+    def shopping_list(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient__name', 'amount'
+        ))
+
+    def test_single_add_and_remove(self):
+        recipe = self.recipes[0]
+        url = self.url(recipe, 'favorite')
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.favorites_count(recipe), 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.favorites_count(recipe), 0)
+
+    def test_bulk_remove(self):
+        ids = {'recipes': [recipe.pk for recipe in self.recipes]}
+        for action in ('bulk_favorite', 'bulk_shopping_cart'):
+            self.client.post(f'{RECIPES_URL}{action}/', ids, format='json')
+        self.assertEqual(self.shopping_list(self.user), {'мука': 300})
+        for action in ('bulk_favorite', 'bulk_shopping_cart'):
+            response = self.client.delete(
+                f'{RECIPES_URL}{action}/', ids, format='json'
+            )
+            self.assertEqual(
+                {item['status'] for item in response.data}, {'removed'}
+            )
+        self.assertEqual(self.favorites_count(self.recipes[0]), 0)
+        self.assertEqual(self.shopping_list(self.user), {})
+
+    def test_bulk_add_counts_only_new_rows(self):
+        self.client.post(self.url(self.recipes[0], 'favorite'))
+        response = self.client.post(f'{RECIPES_URL}bulk_favorite/', {
+            'recipes': [recipe.pk for recipe in self.recipes] + [10 ** 6]
+        }, format='json')
+        self.assertEqual(
+            [item['status'] for item in response.data],
+            ['exists', 'added', 'added', 'not_found']
+        )
+        self.assertEqual(
+            [self.favorites_count(recipe) for recipe in self.recipes],
+            [1, 1, 1]
+        )
+
+    def test_recipe_deleted(self):
+        self.client.post(self.url(self.recipes[0], 'shopping_cart'))
+        self.client.post(self.url(self.recipes[1], 'shopping_cart'))
+        self.recipes[0].delete()
+        self.assertEqual(self.shopping_list(self.user), {'мука': 100})
+
+    def test_user_deleted(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        self.user.delete()
+        self.assertEqual(self.favorites_count(self.recipes[0]), 0)
+
+
+class RecipeUpdateTest(APITestCase):
+    """Правка рецепта пересчитывает производные данные одним пакетом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.buyer = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='pass'
+            )
+            for name in ('editor', 'buyer')
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(16)
+        ]
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#E26C2D', slug='lunch'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, image='recipe/1.png', name='Рецепт',
+            text='Описание', cooking_time=10
+        )
+        cls.recipe.tags.add(cls.tag)
+        for ingredient in cls.ingredients[:8]:
+            IngredientInRecipe.objects.create(
+                recipe=cls.recipe, ingredient=ingredient, amount=100
+            )
+        ShoppingCart.objects.create(user=cls.buyer, recipe=cls.recipe)
+        ShoppingListItem.objects.refresh([cls.buyer.pk])
+        cls.url = f'{RECIPES_URL}{cls.recipe.pk}/'
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def patch(self, amounts):
+        return self.client.patch(self.url, {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts.items()
+            ],
+            'tags': [self.tag.pk],
+        }, format='json')
+
+    def shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.buyer
+        ).values_list('ingredient', 'amount'))
+
+    def test_replace_all_ingredients_queries(self):
+        amounts = dict.fromkeys(self.ingredients[8:], 50)
+        with self.assertNumQueries(23):
+            response = self.patch(amounts)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shopping_list(), {
+            ingredient.pk: 50 for ingredient in self.ingredients[8:]
+        })
+
+    def test_change_one_amount_queries(self):
+        amounts = dict.fromkeys(self.ingredients[:8], 100)
+        amounts[self.ingredients[0]] = 250
+        with self.assertNumQueries(22):
+            response = self.patch(amounts)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shopping_list()[self.ingredients[0].pk], 250)
+
+    def rows(self):
+        return {
+            ingredient: (pk, amount)
+            for pk, ingredient, amount in IngredientInRecipe.objects.filter(
+                recipe=self.recipe
+            ).values_list('id', 'ingredient', 'amount')
+        }
+
+    def writes(self, queries):
+        return [
+            query['sql'].split()[0] for query in queries
+            if INGREDIENT_WRITE.match(query['sql'])
+        ]
+
+    def test_unchanged_rows_keep_ids(self):
+        before = self.rows()
+        amounts = dict.fromkeys(self.ingredients[1:9], 100)
+        amounts[self.ingredients[1]] = 300
+        with CaptureQueriesContext(connection) as queries:
+            self.patch(amounts)
+        after = self.rows()
+        for ingredient in self.ingredients[2:8]:
+            self.assertEqual(after[ingredient.pk], before[ingredient.pk])
+        self.assertEqual(
+            after[self.ingredients[1].pk],
+            (before[self.ingredients[1].pk][0], 300)
+        )
+        self.assertNotIn(self.ingredients[0].pk, after)
+        self.assertEqual(after[self.ingredients[8].pk][1], 100)
+        self.assertEqual(
+            sorted(self.writes(queries)), ['DELETE', 'INSERT', 'UPDATE']
+        )
+
+    def test_same_ingredients_no_writes(self):
+        before = self.rows()
+        with CaptureQueriesContext(connection) as queries:
+            self.patch(dict.fromkeys(self.ingredients[:8], 100))
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(self.writes(queries), [])
+
+
+class ReferenceCacheTest(APITestCase):
+    """Справочники отдаются из кэша с ETag и сбрасываются после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalidated_on_commit(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Обед'
+            self.tag.save()
+            self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Обед')
+
+    def test_unknown_params_share_entry(self):
+        url = '/api/ingredients/'
+        self.client.get(url, {'name': 'му'})
+        entries = len(cache._cache)
+        for junk in range(3):
+            response = self.client.get(url, {'name': 'му', 'junk': junk})
+            self.assertEqual(len(response.json()), 1)
+        self.assertEqual(len(cache._cache), entries)
+        self.client.get(url, {'name': 'са'})
+        self.assertEqual(len(cache._cache), entries + 1)
+
+
+@override_settings(MATCHER_MAX_STALENESS=0)
+class MatcherTest(APITestCase):
+    """Подбор рецептов по ингредиентам следит за правками после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='matcher@example.com', username='matcher',
+            first_name='matcher', last_name='matcher', password='pass'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(8)
+        ]
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#E26C2D', slug='lunch'
+        )
+        cls.full, cls.half, cls.quarter = (
+            cls.create_recipe(name, cls.ingredients[:count])
+            for name, count in (('Всё', 2), ('Половина', 4), ('Четверть', 8))
+        )
+
+    @classmethod
+    def create_recipe(cls, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=cls.author, image='recipe/1.png', name=name,
+            text='Описание', cooking_time=10
+        )
+        for ingredient in ingredients:
+            IngredientInRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100
+            )
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def match(self, *ingredients):
+        response = self.client.get(f'{RECIPES_URL}match/', {
+            'ingredients': ','.join(str(item.pk) for item in ingredients)
+        })
+        return [(item['id'], item['coverage']) for item in response.data]
+
+    def test_ranked_by_coverage(self):
+        self.assertEqual(self.match(*self.ingredients[:2]), [
+            (self.full.pk, 1.0), (self.half.pk, 0.5),
+            (self.quarter.pk, 0.25),
+        ])
+
+    def test_updated_after_commit(self):
+        self.match(self.ingredients[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'{RECIPES_URL}{self.half.pk}/', {
+                'ingredients': [
+                    {'id': self.ingredients[0].pk, 'amount': 100}
+                ],
+                'tags': [self.tag.pk],
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                self.match(self.ingredients[0])[0], (self.full.pk, 0.5)
+            )
+        self.assertEqual(
+            self.match(self.ingredients[0])[0], (self.half.pk, 1.0)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.half.delete()
+        self.assertNotIn(
+            self.half.pk,
+            [recipe_id for recipe_id, _ in self.match(self.ingredients[0])]
+        )
+
+
+class CompiledSerializationTest(APITestCase):
+    """Собранное из кэша представление совпадает с RecipeReadSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='pass'
+            )
+            for name in ('compiled-author', 'compiled-reader')
+        )
+        tags = [
+            Tag.objects.create(name=slug, color='#E26C2D', slug=slug)
+            for slug in ('breakfast', 'lunch')
+        ]
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        cls.tagged, cls.untagged, cls.no_image = (
+            Recipe.objects.create(
+                author=cls.author, image=image, name=name,
+                text='Описание\u2028строка', cooking_time=10
+            )
+            for name, image in (
+                ('С тегами', 'recipe/1.png'),
+                ('Без тегов', 'recipe/2.png'),
+                ('Без картинки', ''),
+            )
+        )
+        cls.tagged.tags.set(tags)
+        cls.no_image.tags.set(tags[:1])
+        for recipe in (cls.tagged, cls.no_image):
+            IngredientInRecipe.objects.create(
+                recipe=recipe, ingredient=flour, amount=100
+            )
+        Favorite.objects.create(user=cls.reader, recipe=cls.tagged)
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.untagged)
+        Subscription.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_same(self, user):
+        request = APIRequestFactory().get(RECIPES_URL)
+        request.user = user
+        queryset = Recipe.objects.for_user(user)
+        expected = dumps(RecipeReadSerializer(
+            queryset, many=True, context={'request': request}
+        ).data)
+        # Второй проход берёт представления из кэша.
+        for _ in range(2):
+            self.assertEqual(
+                dumps(serialize_recipes(recipe_rows(queryset), request)),
+                expected
+            )
+        return json.loads(expected)
+
+    def test_anonymous(self):
+        data = self.assert_same(AnonymousUser())
+        self.assertEqual([recipe['tags'] for recipe in data][1], [])
+        self.assertIsNone(data[0]['image'])
+
+    def test_authenticated(self):
+        data = self.assert_same(self.reader)
+        self.assertEqual(
+            [
+                (recipe['is_favorited'], recipe['is_in_shopping_cart'])
+                for recipe in data
+            ],
+            [(False, False), (False, True), (True, False)]
+        )
+        self.assertTrue(data[0]['author']['is_subscribed'])
+
+
+class RendererTest(APITestCase):
+    """Вставка готовых фрагментов не меняет байты ответа."""
+
+    data = {
+        'count': 2,
+        'next': None,
+        'results': [
+            {'id': 1, 'name': 'Блины', 'tags': [{'id': 1, 'slug': 'a'}]},
+            {'id': 2, 'name': 'Строка\u2028\x00', 'tags': []},
+        ],
+    }
+
+    def render(self, data, indent=None):
+        return ORJSONRenderer().render(
+            data, 'application/json',
+            {'indent': indent} if indent else None
+        )
+
+    def test_fragments_spliced(self):
+        spliced = {**self.data, 'results': [
+            Fragment(dumps(item)) for item in self.data['results']
+        ]}
+        self.assertEqual(self.render(spliced), self.render(self.data))
+        self.assertEqual(
+            self.render(spliced), JSONRenderer().render(self.data)
+        )
+
+    def test_nested_fragments(self):
+        recipe = self.data['results'][0]
+        nested = {
+            'results': [Fragment(dumps({
+                **recipe, 'tags': [Fragment(dumps(recipe['tags'][0]))],
+            }))],
+        }
+        self.assertEqual(
+            self.render(nested), self.render({'results': [recipe]})
+        )
+
+    def test_indented_fallback(self):
+        spliced = {'results': [Fragment(dumps(self.data['results'][0]))]}
+        self.assertEqual(
+            json.loads(self.render(spliced, indent=4)),
+            {'results': [self.data['results'][0]]}
+        )
+
+    def test_paginated_response(self):
+        author = User.objects.create_user(
+            email='renderer@example.com', username='renderer',
+            first_name='renderer', last_name='renderer', password='pass'
+        )
+        for number in range(3):
+            Recipe.objects.create(
+                author=author, image='recipe/1.png', name=f'Рецепт {number}',
+                text='Описание', cooking_time=10
+            )
+        for params in ({'limit': 2}, {'limit': 2, 'pagination': 'cursor'}):
+            response = self.client.get(RECIPES_URL, params)
+            request = response.wsgi_request
+            request.user = AnonymousUser()
+            data = json.loads(response.content)
+            self.assertEqual(len(data['results']), 2)
+            recipes = Recipe.objects.for_user(request.user).filter(
+                pk__in=[recipe['id'] for recipe in data['results']]
+            )
+            self.assertEqual(response.content, JSONRenderer().render({
+                **data,
+                'results': RecipeReadSerializer(
+                    recipes, many=True, context={'request': request}
+                ).data,
+            }))
+
+
+class TempMediaMixin:
+    """Загруженные в тесте файлы пишутся во временный MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        media_settings = override_settings(
+            MEDIA_ROOT=media.name, THUMBNAIL_WORKERS=0
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+class FeedTest(TempMediaMixin, APITestCase):
+    """Лента подписок одинакова при чтении и при рассылке на запись."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.stranger = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='pass'
+            )
+            for name in ('feed-reader', 'feed-author', 'feed-stranger')
+        )
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#E26C2D', slug='lunch'
+        )
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def create_recipe(self, author, name):
+        self.client.force_authenticate(author)
+        response = self.client.post(RECIPES_URL, {
+            'ingredients': [{'id': self.flour.pk, 'amount': 100}],
+            'tags': [self.tag.pk],
+            'image': PNG,
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def feed(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(f'{RECIPES_URL}feed/')
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def subscribe(self, method):
+        self.client.force_authenticate(self.reader)
+        return getattr(self.client, method)(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+
+    def scenario(self):
+        old = self.create_recipe(self.author, 'Старый')
+        self.assertEqual(self.subscribe('post').status_code, 201)
+        new = self.create_recipe(self.author, 'Новый')
+        self.create_recipe(self.stranger, 'Чужой')
+        self.assertEqual(self.feed(), [new, old])
+        self.client.force_authenticate(self.author)
+        self.client.delete(f'{RECIPES_URL}{new}/')
+        self.assertEqual(self.feed(), [old])
+        self.assertEqual(self.subscribe('delete').status_code, 204)
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+
+    def test_read_strategy(self):
+        with override_settings(FEED_STRATEGY='read'):
+            self.scenario()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_write_strategy(self):
+        with override_settings(FEED_STRATEGY='write'):
+            self.scenario()
+
+
+class RecipeImageTest(TempMediaMixin, APITestCase):
+    """Картинки хранятся по содержимому, копии готовятся после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='images@example.com', username='images',
+            first_name='images', last_name='images', password='pass'
+        )
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#E26C2D', slug='lunch'
+        )
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def create_recipe(self, name):
+        response = self.client.post(RECIPES_URL, {
+            'ingredients': [{'id': self.flour.pk, 'amount': 100}],
+            'tags': [self.tag.pk],
+            'image': PNG,
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+    def get_image(self, recipe):
+        return self.client.get(f'{RECIPES_URL}{recipe.pk}/').data['image']
+
+    def test_identical_uploads_stored_once(self):
+        first, second = (
+            self.create_recipe(name) for name in ('Первый', 'Второй')
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.files(), [first.image.name])
+
+    def test_thumbnails_made_synchronously(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe('Рецепт')
+        self.assertEqual(self.files(), sorted([
+            recipe.image.name,
+            thumbnail_name(recipe.image.name, 'card'),
+            thumbnail_name(recipe.image.name, 'detail'),
+        ]))
+
+    def test_representation_forgotten_when_thumbnails_ready(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = self.create_recipe('Рецепт')
+        self.assertTrue(self.get_image(recipe).endswith(recipe.image.name))
+        # Пока копии нет, ссылка не кэшируется.
+        self.assertIsNone(cache.get(recipe_key(recipe.pk))['image_url'])
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        self.assertIsNone(cache.get(recipe_key(recipe.pk)))
+        detail = thumbnail_name(recipe.image.name, 'detail')
+        self.assertTrue(self.get_image(recipe).endswith(detail))
+        self.assertTrue(
+            cache.get(recipe_key(recipe.pk))['image_url'].endswith(detail)
+        )
+
+
+class RepresentationCacheTest(APITestCase):
+    """Кэш представлений сбрасывается только после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='cache@example.com', username='cache',
+            first_name='cache', last_name='cache', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author, image='recipe/1.png', name='Старое название',
+            text='Описание', cooking_time=10
+        )
+        cls.url = f'{RECIPES_URL}{cls.recipe.pk}/'
+
+    def setUp(self):
+        cache.clear()
+
+    def get_name(self):
+        return self.client.get(self.url).data['name']
+
+    def test_forgotten_on_commit(self):
+        self.get_name()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+            self.assertEqual(self.get_name(), 'Старое название')
+        self.assertTrue(callbacks)
+        self.assertEqual(self.get_name(), 'Новое название')
+
+    def test_forgotten_when_thumbnails_ready(self):
+        self.get_name()
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Новое название')
+        with self.captureOnCommitCallbacks(execute=True):
+            thumbnails_ready.send(sender=None, name=self.recipe.image.name)
+        self.assertEqual(self.get_name(), 'Новое название')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'foodgram-tests-cache'),
+}})
+class TokenCacheTest(APITestCase):
+    """Кэш токенов с общим кэшем Django."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='old-password'
+            )
+            for name in ('token-author', 'token-reader')
+        )
+        cls.token = Token.objects.create(user=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_user_keeps_counters(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        # Остаётся только запрос подписки для is_subscribed.
+        with self.assertNumQueries(1):
+            self.client.get('/api/users/me/')
+        Subscription.objects.create(user=self.reader, author=self.author)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-password',
+            'new_password': 'new-Passw0rd-42',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertTrue(self.author.check_password('new-Passw0rd-42'))
+
+    def test_logout_revokes_token(self):
+        self.client.get('/api/users/me/')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.token.delete()
+        self.assertTrue(callbacks)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_profile_change_forgotten_on_commit(self):
+        self.client.get('/api/users/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Новое имя'
+            self.author.save()
+            self.assertEqual(
+                self.client.get('/api/users/me/').data['first_name'],
+                'token-author'
+            )
+        self.assertEqual(
+            self.client.get('/api/users/me/').data['first_name'], 'Новое имя'
+        )
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_local_cache_not_used(self):
+        self.client.get('/api/users/me/')
+        with self.assertNumQueries(2):
+            self.client.get('/api/users/me/')
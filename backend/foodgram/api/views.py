@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import (Exists, F, OuterRef, Prefetch, Value,
+                              prefetch_related_objects)
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserViewSet
@@ -10,31 +13,54 @@ from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.status import HTTP_204_NO_CONTENT
 
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.signals import user_recipes_changed
+from recipes.units import normalize
 from users.models import Subscription
+from .autocomplete import DEFAULT_LIMIT, autocomplete
+from .caching import ReferenceCacheMixin
+from .compiled import recipe_rows, serialize_recipes
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .matcher import DEFAULT_LIMIT as MATCH_LIMIT
+from .matcher import MAX_LIMIT as MAX_MATCH_LIMIT
+from .matcher import matcher
+from .pagination import CustomCursorPagination, CustomPagination
 from .permissions import IsAdminAuthorOrReadOnly, IsAdminOrReadOnly
-from .serializers import (IngredientSerializer, RecipeReadSerializer,
-                          RecipeSerializer, ShortRecipeSerializer,
-                          SubscriptionSerializer, TagSerializer)
+from .serializers import (BulkRecipeSerializer, IngredientSerializer,
+                          RecipeReadSerializer, RecipeSerializer,
+                          ShortRecipeSerializer, SubscriptionSerializer,
+                          TagSerializer)
+from .shopping_cart import FORMATS
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
+    cache_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
+    cache_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
     filterset_class = IngredientFilter
 
+    @action(detail=False)
+    def autocomplete(self, request):
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'errors': 'limit должен быть числом.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            autocomplete(request.query_params.get('name', ''), limit)
+        )
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAdminAuthorOrReadOnly,)
@@ -48,30 +74,147 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeSerializer
 
     def get_queryset(self):
-        is_favorited = self.request.query_params.get('is_favorited')
-        if is_favorited is not None and int(is_favorited) == 1:
-            return Recipe.objects.filter(favorites__user=self.request.user)
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart')
-        if is_in_shopping_cart is not None and int(is_in_shopping_cart) == 1:
-            return Recipe.objects.filter(shopping_cart__user=self.request.user)
-        return Recipe.objects.all()
+        return Recipe.objects.for_user(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        queryset = recipe_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(serialize_recipes(page, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        recipes = serialize_recipes(
+            recipe_rows(self.get_queryset().filter(pk=pk)), request
+        )
+        if not recipes:
+            raise Http404
+        return Response(recipes[0])
+
+    @action(detail=False)
+    def match(self, request):
+        try:
+            ingredient_ids = [
+                int(value)
+                for values in request.query_params.getlist('ingredients')
+                for value in values.split(',') if value
+            ]
+            limit = int(request.query_params.get('limit', MATCH_LIMIT))
+        except ValueError:
+            return Response(
+                {'errors': 'Ингредиенты и limit должны быть числами.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        matches = matcher.match(
+            ingredient_ids, max(1, min(limit, MAX_MATCH_LIMIT))
+        )
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _ in matches]
+        )
+        return Response([
+            {
+                **ShortRecipeSerializer(
+                    recipes[recipe_id], context={'request': request}
+                ).data,
+                'coverage': round(coverage, 4),
+            }
+            for recipe_id, coverage in matches if recipe_id in recipes
+        ])
+
+    @staticmethod
+    def lock_user(user):
+        """Блокирует строку пользователя до конца транзакции.
+
+        Одиночное и массовое добавление одного пользователя идут по
+        очереди, поэтому массовое знает, какие строки вставило само.
+        """
+        list(User.objects.select_for_update().filter(
+            pk=user.pk
+        ).values_list('pk', flat=True))
 
     @staticmethod
     def add_or_del(request, pk, model):
         recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'DELETE':
-            model_object = get_object_or_404(model, user=request.user,
-                                             recipe=recipe)
-            model_object.delete()
+            with transaction.atomic():
+                deleted, _ = model.objects.filter(
+                    user=request.user, recipe=recipe
+                ).delete()
+                if not deleted:
+                    raise Http404
+                user_recipes_changed.send(
+                    sender=model, user=request.user, removed=[recipe.pk]
+                )
             return Response(status=HTTP_204_NO_CONTENT)
-        if model.objects.filter(recipe=recipe, user=request.user).exists():
+        try:
+            with transaction.atomic():
+                RecipeViewSet.lock_user(request.user)
+                model.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
+            # Ошибку могли дать и обработчики post_save; повтором считаем
+            # только уже существующую пару (user, recipe).
+            if not model.objects.filter(
+                user=request.user, recipe=recipe
+            ).exists():
+                raise
             return Response({'errors': 'Рецепт уже добавлен.'},
                             status=status.HTTP_400_BAD_REQUEST)
-        model.objects.create(user=request.user, recipe=recipe)
         data = ShortRecipeSerializer(recipe)
         return Response(data.data, status=status.HTTP_201_CREATED)
 
+    @staticmethod
+    @transaction.atomic
+    def bulk_add_or_del(request, model):
+        """Добавляет или удаляет список рецептов за пару запросов.
+
+        Возвращает результат для каждого id: added/exists при добавлении,
+        removed/absent при удалении, not_found для несуществующих.
+        """
+        serializer = BulkRecipeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        RecipeViewSet.lock_user(request.user)
+        found = dict(
+            Recipe.objects.filter(id__in=recipe_ids).annotate(
+                present=Exists(model.objects.filter(
+                    user=request.user, recipe=OuterRef('pk')
+                ))
+            ).values_list('id', 'present')
+        )
+        adding = request.method == 'POST'
+        changed = [pk for pk, present in found.items() if present != adding]
+        if adding:
+            # Под блокировкой пользователя пары из changed никто другой
+            # не вставит, так что конфликтов не будет и все они новые.
+            model.objects.bulk_create(
+                model(user=request.user, recipe_id=pk) for pk in changed
+            )
+            user_recipes_changed.send(
+                sender=model, user=request.user, added=changed
+            )
+            statuses = ('exists', 'added')
+        else:
+            # Без обработчиков post_delete это один DELETE без выборки
+            # объектов; производные данные обновляет user_recipes_changed.
+            model.objects.filter(
+                user=request.user, recipe__in=changed
+            ).delete()
+            user_recipes_changed.send(
+                sender=model, user=request.user, removed=changed
+            )
+            statuses = ('absent', 'removed')
+        changed = set(changed)
+        return Response([
+            {
+                'id': pk,
+                'status': (
+                    statuses[pk in changed] if pk in found else 'not_found'
+                ),
+            }
+            for pk in recipe_ids
+        ])
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -88,33 +231,91 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk):
         return self.add_or_del(request, pk, ShoppingCart)
 
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def bulk_favorite(self, request):
+        return self.bulk_add_or_del(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def bulk_shopping_cart(self, request):
+        return self.bulk_add_or_del(request, ShoppingCart)
+
     @action(
         detail=False,
         permission_classes=[permissions.IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(quantity=Sum('amount'))
-        shopping = 'Список покупок\n'
-        shopping += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["quantity"]}'
-            for ingredient in ingredients
-        ])
-        response = HttpResponse(shopping,
-                                'Content-Type: application/pdf')
+        file_type = request.query_params.get('type', 'pdf')
+        if file_type not in FORMATS:
+            return Response(
+                {'errors': f'Формат {file_type} не поддерживается.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        content_type, render = FORMATS[file_type]
+        response = StreamingHttpResponse(
+            render(self.shopping_list(request.user)),
+            content_type=content_type
+        )
         response[
             "Content-Disposition"
-        ] = 'attachment; filename="shopping.pdf"'
+        ] = f'attachment; filename="shopping.{file_type}"'
         return response
 
+    @staticmethod
+    def shopping_list(user):
+        """Итоги списка покупок, сведённые к общим единицам измерения."""
+        return normalize(ShoppingListItem.objects.filter(
+            user=user
+        ).order_by('ingredient__name').values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            total=F('amount'),
+        ).iterator())
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_cart_totals(self, request):
+        return Response([
+            {
+                'name': row['name'],
+                'measurement_unit': row['measurement_unit'],
+                'amount': row['total'],
+            }
+            for row in self.shopping_list(request.user)
+        ])
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def feed(self, request):
+        queryset = self.get_queryset()
+        if settings.FEED_STRATEGY == 'write':
+            queryset = queryset.filter(feed_entries__user=request.user)
+        else:
+            queryset = queryset.filter(author__in=Subscription.objects.filter(
+                user=request.user
+            ).values('author'))
+        paginator = CustomCursorPagination()
+        page = paginator.paginate_queryset(
+            recipe_rows(queryset), request, view=self
+        )
+        return paginator.get_paginated_response(
+            serialize_recipes(page, request)
+        )
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        if settings.FEED_STRATEGY == 'write':
+            FeedEntry.objects.fan_out(recipe)
 
 
 class UserViewSet(DjoserViewSet):
@@ -138,8 +339,8 @@ class UserViewSet(DjoserViewSet):
             return Response(
                 {'errors': 'Вы уже подписаны на этого пользователя.'},
                 status=status.HTTP_400_BAD_REQUEST)
-        subscribe = Subscription.objects.create(user=user, author=author)
-        data = SubscriptionSerializer(subscribe)
+        Subscription.objects.create(user=user, author=author)
+        data = SubscriptionSerializer(author, context={'request': request})
         return Response(data.data, status=status.HTTP_201_CREATED)
 
     @action(
@@ -149,8 +350,15 @@ class UserViewSet(DjoserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(subscription_author__user=user)
+        queryset = User.objects.filter(
+            subscription_author__user=user
+        ).annotate(is_subscribed=Value(True))
         pages = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.latest_per_author(int(limit))
+        prefetch_related_objects(pages, Prefetch('recipe', queryset=recipes))
         serializer = SubscriptionSerializer(
             pages,
             many=True,
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -7,6 +8,8 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 
 DEBUG = True
 
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = [
     '158.160.50.23',
     'localhost',
@@ -72,6 +75,19 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=20000)),
+        },
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -103,10 +119,48 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+FEED_STRATEGY = os.getenv('FEED_STRATEGY', default='read')
+FEED_MAX_ENTRIES = int(os.getenv('FEED_MAX_ENTRIES', default=500))
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=600))
+REFERENCE_CACHE_TIMEOUT = int(
+    os.getenv('REFERENCE_CACHE_TIMEOUT', default=3600)
+)
+
+MATCHER_MAX_STALENESS = int(os.getenv('MATCHER_MAX_STALENESS', default=60))
+
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', default=2))
+
+# Кэш токенов работает только с общим CACHE_BACKEND (Redis, Memcached,
+# база данных). С LocMemCache по умолчанию и с DummyCache сброс не дошёл
+# бы до других воркеров, поэтому токен проверяется запросом к БД.
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', default=60))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', default=10000))
+
+# Счётчик запросов нужен при разработке и в тестах: в продакшене он
+# добавляет execute_wrapper и разбор стека на каждый запрос к БД.
+# DEBUG здесь всегда True, поэтому включается отдельным флагом.
+QUERY_BUDGET_ENABLED = os.getenv(
+    'QUERY_BUDGET_ENABLED', default=str(TESTING)
+) == 'True'
+if QUERY_BUDGET_ENABLED:
+    MIDDLEWARE.insert(0, 'api.query_budget.QueryBudgetMiddleware')
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', default=10))
+QUERY_BUDGET_WRITE = int(os.getenv('QUERY_BUDGET_WRITE', default=30))
+QUERY_BUDGET_REPEATS = int(os.getenv('QUERY_BUDGET_REPEATS', default=3))
+QUERY_BUDGET_STRICT = os.getenv(
+    'QUERY_BUDGET_STRICT', default=str(TESTING)
+) == 'True'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+SHOPPING_CART_FONT = os.getenv(
+    'SHOPPING_CART_FONT',
+    default=os.path.join(BASE_DIR, 'api', 'fonts', 'arial.ttf')
+)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -115,7 +169,16 @@ REST_FRAMEWORK = {
         "django_filters.rest_framework.DjangoFilterBackend"
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
@@ -1,7 +1,13 @@
+from collections import defaultdict
+
 from django.contrib import admin
+from django.contrib.auth import get_user_model
 
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     RecipeRanking, ShoppingCart, ShoppingListItem, Tag)
+from .signals import recipe_ingredients_changed, user_recipes_changed
+
+User = get_user_model()
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -9,20 +15,40 @@ class TagAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
-    readonly_fields = ('count_favorites',)
+    readonly_fields = ('favorites_count',)
 
-    def count_favorites(self, obj):
-        return obj.favorites.count()
 
+class UserRecipeAdmin(admin.ModelAdmin):
+    """Избранное и корзина: удаление шлёт user_recipes_changed."""
 
-class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
 
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        user_recipes_changed.send(
+            sender=self.model, user=obj.user, removed=[obj.recipe_id]
+        )
 
-class FavoriteAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe')
+    def delete_queryset(self, request, queryset):
+        removed = defaultdict(list)
+        for user_id, recipe_id in queryset.values_list('user', 'recipe'):
+            removed[user_id].append(recipe_id)
+        super().delete_queryset(request, queryset)
+        for user in User.objects.filter(pk__in=removed):
+            user_recipes_changed.send(
+                sender=self.model, user=user, removed=removed[user.pk]
+            )
+
+
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+
+
+class RecipeRankingAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'popularity', 'trending', 'updated')
+    readonly_fields = ('popularity', 'trending', 'updated')
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -30,12 +56,45 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 class IngredientInRecipeAdmin(admin.ModelAdmin):
+    """Правки состава рецепта шлют recipe_ingredients_changed."""
+
     list_display = ('id', 'recipe', 'ingredient')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Правка строки могла сменить сам ингредиент, тогда список
+        # покупок пересчитывается целиком.
+        recipe_ingredients_changed.send(
+            sender=self.model,
+            recipe_ids=[obj.recipe_id],
+            ingredient_ids=None if change else [obj.ingredient_id]
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recipe_ingredients_changed.send(
+            sender=self.model,
+            recipe_ids=[obj.recipe_id],
+            ingredient_ids=[obj.ingredient_id]
+        )
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list('recipe', 'ingredient'))
+        super().delete_queryset(request, queryset)
+        if rows:
+            recipe_ids, ingredient_ids = map(set, zip(*rows))
+            recipe_ingredients_changed.send(
+                sender=self.model,
+                recipe_ids=recipe_ids,
+                ingredient_ids=ingredient_ids
+            )
+
 
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Recipe, RecipeAdmin)
-admin.site.register(ShoppingCart, ShoppingCartAdmin)
-admin.site.register(Favorite, FavoriteAdmin)
+admin.site.register(ShoppingCart, UserRecipeAdmin)
+admin.site.register(Favorite, UserRecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(IngredientInRecipe, IngredientInRecipeAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
+admin.site.register(RecipeRanking, RecipeRankingAdmin)
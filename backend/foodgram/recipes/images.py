@@ -0,0 +1,122 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections
+from django.dispatch import Signal
+from django.utils.deconstruct import deconstructible
+from PIL import Image, features
+
+THUMBNAIL_SIZES = {
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+THUMBNAIL_QUALITY = 80
+if features.check('webp'):
+    THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = 'WEBP', 'webp'
+else:
+    THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = 'JPEG', 'jpg'
+
+thumbnails_ready = Signal()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем SHA-256 их содержимого.
+
+    Повторная загрузка той же картинки не пишет файл заново.
+    """
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        name = os.path.join(
+            directory,
+            hexdigest[:2],
+            hexdigest + os.path.splitext(filename)[1].lower()
+        )
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def save_exact(self, name, content):
+        if self.exists(name):
+            return name
+        return super().save(name, content)
+
+
+def thumbnail_name(name, variant):
+    return f'{os.path.splitext(name)[0]}_{variant}.{THUMBNAIL_EXTENSION}'
+
+
+def make_thumbnails(storage, name):
+    missing = {
+        variant: size for variant, size in THUMBNAIL_SIZES.items()
+        if not storage.exists(thumbnail_name(name, variant))
+    }
+    if not missing:
+        return
+    with storage.open(name) as file, Image.open(file) as image:
+        image.load()
+        if THUMBNAIL_FORMAT == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        for variant, size in missing.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail(size)
+            buffer = BytesIO()
+            thumbnail.save(
+                buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY
+            )
+            storage.save_exact(
+                thumbnail_name(name, variant), ContentFile(buffer.getvalue())
+            )
+    thumbnails_ready.send(sender=storage.__class__, name=name)
+
+
+in_progress = set()
+in_progress_lock = Lock()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.THUMBNAIL_WORKERS,
+        thread_name_prefix='thumbnails'
+    )
+
+
+def run_once(storage, name):
+    try:
+        make_thumbnails(storage, name)
+    finally:
+        with in_progress_lock:
+            in_progress.discard(name)
+
+
+def run_in_worker(storage, name):
+    # Обработчики thumbnails_ready ходят в БД из потока пула.
+    try:
+        run_once(storage, name)
+    finally:
+        connections.close_all()
+
+
+def schedule_thumbnails(storage, name):
+    with in_progress_lock:
+        if name in in_progress:
+            return
+        in_progress.add(name)
+    if settings.THUMBNAIL_WORKERS:
+        get_executor().submit(run_in_worker, storage, name)
+    else:
+        run_once(storage, name)
@@ -0,0 +1,258 @@
+import random
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes.images import make_thumbnails
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import recipe_ingredients_changed
+from users.models import Subscription
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+SIGNAL_BATCH_SIZE = 500
+DEFAULT_PASSWORD = 'benchmark'
+DISHES = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'омлет',
+    'паста', 'плов', 'блины', 'котлеты', 'десерт',
+)
+STYLES = (
+    'домашний', 'быстрый', 'праздничный', 'летний', 'зимний', 'острый',
+    'нежный', 'постный', 'сытный', 'бабушкин',
+)
+COLORS = (
+    '#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#56CCF2', '#EB5757',
+)
+
+
+def placeholder_image():
+    buffer = BytesIO()
+    Image.new('RGB', (1200, 800), '#E26C2D').save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт воспроизводимый синтетический набор данных: '
+        'пользователей, подписки, рецепты, избранное и корзины'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument(
+            '--recipes', type=int, default=10,
+            help='Рецептов на пользователя'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок на пользователя'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в корзине у пользователя'
+        )
+        parser.add_argument(
+            '--followers', type=int, default=0,
+            help='Дополнительных подписчиков у первого пользователя набора'
+        )
+        parser.add_argument('--tags', type=int, default=8)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='bench',
+            help='Префикс имён пользователей и тегов набора'
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить ранее созданный набор с тем же префиксом'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        users = User.objects.filter(username__startswith=prefix)
+        if users.exists():
+            if not options['clear']:
+                raise CommandError(
+                    f'Набор {prefix} уже существует, используйте --clear'
+                )
+            users.delete()
+            Tag.objects.filter(slug__startswith=prefix).delete()
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        with transaction.atomic():
+            user_ids = self.create_users(options)
+            recipe_ids = self.create_recipes(rng, user_ids, options)
+            self.create_links(rng, user_ids, recipe_ids, options)
+            self.create_followers(user_ids[0], options)
+        self.rebuild_derived(recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}'
+        ))
+
+    def create_users(self, options):
+        prefix = options['prefix']
+        password = make_password(DEFAULT_PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=prefix,
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(options['users'])
+            ),
+            batch_size=BATCH_SIZE
+        )
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, rng, user_ids, options):
+        storage = Recipe._meta.get_field('image').storage
+        image = storage.save(
+            Recipe._meta.get_field('image').generate_filename(
+                None, 'placeholder.png'
+            ),
+            placeholder_image()
+        )
+        make_thumbnails(storage, image)
+        tag_ids = self.create_tags(options)
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        names = dict(Ingredient.objects.values_list('id', 'name'))
+        plans = []
+        for author_id in user_ids:
+            for _ in range(options['recipes']):
+                ingredients = rng.sample(
+                    ingredient_ids,
+                    min(options['ingredients_per_recipe'],
+                        len(ingredient_ids))
+                )
+                plans.append((author_id, ingredients, rng.sample(
+                    tag_ids, min(options['tags_per_recipe'], len(tag_ids))
+                )))
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author_id,
+                    name=f'{rng.choice(STYLES)} {rng.choice(DISHES)}',
+                    text=', '.join(names[pk] for pk in ingredients),
+                    cooking_time=rng.randint(5, 180),
+                    image=image,
+                )
+                for author_id, ingredients, _ in plans
+            ),
+            batch_size=BATCH_SIZE
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            author__in=user_ids
+        ).order_by('id').values_list('id', flat=True))
+        IngredientInRecipe.objects.bulk_create(
+            (
+                IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe_id, (_, ingredients, _) in zip(recipe_ids, plans)
+                for ingredient_id in ingredients
+            ),
+            batch_size=BATCH_SIZE
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id, (_, _, tags) in zip(recipe_ids, plans)
+                for tag_id in tags
+            ),
+            batch_size=BATCH_SIZE
+        )
+        return recipe_ids
+
+    def create_tags(self, options):
+        prefix = options['prefix']
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'{prefix} {number}',
+                color=COLORS[number % len(COLORS)],
+                slug=f'{prefix}-{number}',
+            )
+            for number in range(options['tags'])
+        )
+        return list(Tag.objects.filter(
+            slug__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_links(self, rng, user_ids, recipe_ids, options):
+        for model, field, targets, count in (
+            (Subscription, 'author_id', user_ids, options['subscriptions']),
+            (Favorite, 'recipe_id', recipe_ids, options['favorites']),
+            (ShoppingCart, 'recipe_id', recipe_ids, options['cart']),
+        ):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user_id, **{field: target})
+                    for user_id in user_ids
+                    for target in rng.sample(targets, min(count, len(targets)))
+                    if target != user_id or model is not Subscription
+                ),
+                batch_size=BATCH_SIZE
+            )
+
+    def create_followers(self, author_id, options):
+        """Подписчики без своих рецептов для замера рассылки в ленты."""
+        prefix = f'{options["prefix"]}-follower'
+        password = make_password(DEFAULT_PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=prefix,
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(options['followers'])
+            ),
+            batch_size=BATCH_SIZE
+        )
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id in User.objects.filter(
+                    username__startswith=prefix
+                ).values_list('id', flat=True).iterator()
+            ),
+            batch_size=BATCH_SIZE
+        )
+
+    def rebuild_derived(self, recipe_ids):
+        """Массовые вставки не шлют сигналов: пересобираем всё явно."""
+        call_command('recount_counters', stdout=self.stdout)
+        if settings.FEED_STRATEGY == 'write':
+            call_command('rebuild_feeds', stdout=self.stdout)
+        call_command('update_rankings', stdout=self.stdout)
+        for start in range(0, len(recipe_ids), SIGNAL_BATCH_SIZE):
+            recipe_ingredients_changed.send(
+                sender=self.__class__,
+                recipe_ids=recipe_ids[start:start + SIGNAL_BATCH_SIZE]
+            )
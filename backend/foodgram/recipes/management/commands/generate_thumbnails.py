@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие уменьшенные копии картинок рецептов'
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        names = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct().order_by()
+        count = 0
+        for name in names.iterator():
+            if not storage.exists(name):
+                self.stderr.write(f'Файл {name} не найден')
+                continue
+            make_thumbnails(storage, name)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано картинок: {count}'))
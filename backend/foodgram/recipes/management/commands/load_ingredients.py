@@ -0,0 +1,114 @@
+import csv
+import json
+import os
+import time
+from io import StringIO
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Ingredient
+from recipes.signals import ingredients_loaded
+
+# Файл лежит в пакете приложения и попадает в образ вместе с кодом.
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR, 'recipes', 'data', 'ingredients.csv'
+)
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as file:
+        for item in json.load(file):
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        write = (
+            self.copy if connection.vendor == 'postgresql'
+            else self.bulk_create
+        )
+        start = time.monotonic()
+        created = skipped = 0
+        with transaction.atomic():
+            existing = set(
+                Ingredient.objects.values_list('name', 'measurement_unit')
+            )
+            for chunk in chunked(reader(path), options['batch_size']):
+                rows = []
+                for name, measurement_unit in chunk:
+                    key = (name.strip(), measurement_unit.strip())
+                    if not all(key) or key in existing:
+                        skipped += 1
+                        continue
+                    existing.add(key)
+                    rows.append(key)
+                if rows:
+                    write(rows)
+                created += len(rows)
+                self.stdout.write(
+                    f'Обработано {created + skipped}, добавлено {created}'
+                )
+            if created:
+                transaction.on_commit(
+                    lambda: ingredients_loaded.send(sender=self.__class__)
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено {created}, пропущено {skipped} '
+            f'за {time.monotonic() - start:.2f} с'
+        ))
+
+    @staticmethod
+    def bulk_create(rows):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in rows
+        )
+
+    @staticmethod
+    def copy(rows):
+        buffer = StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {Ingredient._meta.db_table} (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
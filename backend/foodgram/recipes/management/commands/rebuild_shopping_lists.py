@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводные списки покупок пользователей'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.refresh(
+                ShoppingCart.objects.values('user')
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Позиций в списках: {ShoppingListItem.objects.count()}'
+        ))
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.19 on 2026-10-18 16:49
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_created(apps, schema_editor):
+    """Старым строкам даёт дату регистрации пользователя.
+
+    Своей даты у рецепта нет, а now() сделало бы всю историю свежей
+    и подняла бы её в trending. Добавить в избранное раньше
+    регистрации нельзя, так что это самая ранняя честная оценка.
+    """
+    User = apps.get_model('users', 'User')
+    joined = Subquery(
+        User.objects.filter(pk=OuterRef('user')).values('date_joined')[:1]
+    )
+    for name in ('Favorite', 'ShoppingCart'):
+        apps.get_model('recipes', name).objects.filter(
+            created__isnull=True
+        ).update(created=joined)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_feedentry'),
+        ('users', '0006_user_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popularity', models.FloatField(db_index=True, verbose_name='Популярность')),
+                ('trending', models.FloatField(db_index=True, verbose_name='Популярность за последние дни')),
+                ('updated', models.DateTimeField(verbose_name='Пересчитано')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(null=True, verbose_name='Добавлено'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(null=True, verbose_name='Добавлено'),
+        ),
+        # NOT NULL и индексы ставит 0014: в PostgreSQL ALTER TABLE после
+        # UPDATE в той же транзакции падает на отложенных триггерах.
+        migrations.RunPython(fill_created, migrations.RunPython.noop),
+    ]
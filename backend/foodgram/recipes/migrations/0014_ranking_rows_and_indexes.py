@@ -0,0 +1,64 @@
+# Generated by Django 3.2.19 on 2026-10-18 21:10
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_rankings(apps, schema_editor):
+    """Нулевой рейтинг для рецептов, которые ещё не пересчитывались."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRanking = apps.get_model('recipes', 'RecipeRanking')
+    now = timezone.now()
+    RecipeRanking.objects.bulk_create(
+        (
+            RecipeRanking(recipe_id=recipe_id, updated=now)
+            for recipe_id in Recipe.objects.filter(
+                ranking__isnull=True
+            ).values_list('id', flat=True).iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_interaction_timestamps_recipe_ranking'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Добавлено'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Добавлено'),
+        ),
+        migrations.AlterField(
+            model_name='reciperanking',
+            name='popularity',
+            field=models.FloatField(default=0, verbose_name='Популярность'),
+        ),
+        migrations.AlterField(
+            model_name='reciperanking',
+            name='trending',
+            field=models.FloatField(default=0, verbose_name='Популярность за последние дни'),
+        ),
+        migrations.AlterField(
+            model_name='reciperanking',
+            name='updated',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Пересчитано'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-popularity', '-recipe'], name='ranking_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-trending', '-recipe'], name='ranking_trending_idx'),
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,20 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Exists, OuterRef, Prefetch, Subquery, Sum,
+                              Value)
+from django.db.models.functions import Coalesce
+
+from users.models import CounterFieldsMixin, Subscription
+from .images import ContentAddressedStorage
 
 User = get_user_model()
 
+SEARCH_CONFIG = 'russian'
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -46,7 +57,66 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def update_search_vector(self):
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        ingredient_names = IngredientInRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(
+                Coalesce(Subquery(ingredient_names), Value('')),
+                weight='B',
+                config=SEARCH_CONFIG
+            )
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+
+    def latest_per_author(self, limit):
+        return self.filter(pk__in=Subquery(
+            self.model.objects.filter(
+                author=OuterRef('author')
+            ).order_by('-id').values('pk')[:limit]
+        ))
+
+    def for_user(self, user):
+        queryset = self.prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'ingredient_in_recipe',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('id')
+            ),
+        )
+        if user.is_anonymous:
+            return queryset.select_related('author').annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        authors = User.objects.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        )
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors)
+        ).annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -66,6 +136,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipe',
+        storage=ContentAddressedStorage(),
         verbose_name='Картинка',
     )
     name = models.CharField(
@@ -84,11 +155,30 @@ class Recipe(models.Model):
             )
         ]
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count',)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -107,6 +197,11 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепты',
     )
+    created = models.DateTimeField(
+        verbose_name='Добавлено',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         constraints = [
@@ -131,6 +226,11 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепты',
     )
+    created = models.DateTimeField(
+        verbose_name='Добавлено',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         constraints = [
@@ -174,3 +274,171 @@ class IngredientInRecipe(models.Model):
                 name='Unique_ingredient_in_recipe')
         ]
         db_table = 'recipe_recipe_ingredient'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    @transaction.atomic
+    def refresh(self, users, ingredients=None):
+        """Пересчитывает сводный список покупок пользователей.
+
+        Если переданы ингредиенты, пересчитываются только их строки.
+        Строки пользователей блокируются до конца транзакции, чтобы
+        параллельные пересчёты одного списка не вставляли дубли.
+        """
+        list(User.objects.select_for_update().filter(
+            pk__in=users
+        ).order_by('pk').values_list('pk', flat=True))
+        items = self.filter(user__in=users)
+        totals = IngredientInRecipe.objects.filter(
+            recipe__shopping_cart__user__in=users
+        )
+        if ingredients is not None:
+            items = items.filter(ingredient__in=ingredients)
+            totals = totals.filter(ingredient__in=ingredients)
+        items.delete()
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=row['recipe__shopping_cart__user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['total'],
+                )
+                for row in totals.values(
+                    'recipe__shopping_cart__user', 'ingredient'
+                ).annotate(total=Sum('amount')).order_by().iterator()
+            ),
+            batch_size=1000
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item')
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Сводный список покупок'
+
+
+class FeedEntryQuerySet(models.QuerySet):
+
+    def prune(self, users):
+        keep = settings.FEED_MAX_ENTRIES
+        self.filter(user__in=users).filter(recipe__lt=Subquery(
+            self.model.objects.filter(
+                user=OuterRef('user')
+            ).order_by('-recipe_id').values('recipe')[keep - 1:keep]
+        )).delete()
+
+    def fan_out(self, recipe):
+        subscribers = Subscription.objects.filter(
+            author=recipe.author_id
+        ).values('user')
+        self.bulk_create(
+            (
+                self.model(user_id=user_id, recipe=recipe)
+                for user_id in subscribers.values_list(
+                    'user', flat=True
+                ).iterator()
+            ),
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+        self.prune(subscribers)
+
+    def backfill(self, user, author):
+        self.bulk_create(
+            (
+                self.model(user_id=user, recipe_id=recipe_id)
+                for recipe_id in Recipe.objects.filter(
+                    author=author
+                ).values_list('id', flat=True)[:settings.FEED_MAX_ENTRIES]
+            ),
+            ignore_conflicts=True
+        )
+        self.prune([user])
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry')
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+
+
+class RecipeRanking(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Рецепт',
+    )
+    popularity = models.FloatField(
+        verbose_name='Популярность',
+        default=0,
+    )
+    trending = models.FloatField(
+        verbose_name='Популярность за последние дни',
+        default=0,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Пересчитано',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        # Строка рейтинга есть у каждого рецепта, поэтому сортировка
+        # идёт через INNER JOIN и читает индекс по убыванию без сортировки.
+        indexes = [
+            models.Index(
+                fields=('-popularity', '-recipe'),
+                name='ranking_popularity_idx'
+            ),
+            models.Index(
+                fields=('-trending', '-recipe'),
+                name='ranking_trending_idx'
+            ),
+        ]
@@ -0,0 +1,160 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from users.models import Subscription
+from .images import schedule_thumbnails
+from .models import (Favorite, FeedEntry, Ingredient, IngredientInRecipe,
+                     Recipe, RecipeRanking, ShoppingCart, ShoppingListItem)
+
+User = get_user_model()
+
+ingredients_loaded = Signal()
+# У IngredientInRecipe нет обработчиков post_save/post_delete: кто
+# меняет состав рецептов, тот шлёт recipe_ingredients_changed с
+# recipe_ids и, если известно, ingredient_ids затронутых ингредиентов.
+recipe_ingredients_changed = Signal()
+user_recipes_changed = Signal()
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def create_ranking(instance, created, **kwargs):
+    if created:
+        RecipeRanking.objects.create(recipe=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def create_thumbnails(instance, **kwargs):
+    if instance.image:
+        storage, name = instance.image.storage, instance.image.name
+        transaction.on_commit(lambda: schedule_thumbnails(storage, name))
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    User.objects.filter(
+        pk=instance.author_id, recipes_count__gt=0
+    ).update(
+        recipes_count=F('recipes_count') - 1
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.refresh(
+            [instance.user_id],
+            IngredientInRecipe.objects.filter(
+                recipe=instance.recipe_id
+            ).values('ingredient')
+        )
+
+
+@receiver(user_recipes_changed, sender=Favorite)
+def update_favorites_counts(added=(), removed=(), **kwargs):
+    """Счётчики для массовых вставок и для любых удалений.
+
+    У Favorite и ShoppingCart нет обработчиков post_delete, поэтому
+    QuerySet.delete() удаляет строки одним запросом. Кто удаляет, тот
+    шлёт user_recipes_changed.
+    """
+    Recipe.objects.filter(pk__in=added).update(
+        favorites_count=F('favorites_count') + 1
+    )
+    Recipe.objects.filter(pk__in=removed, favorites_count__gt=0).update(
+        favorites_count=F('favorites_count') - 1
+    )
+
+
+@receiver(user_recipes_changed, sender=ShoppingCart)
+def update_shopping_list(user, added=(), removed=(), **kwargs):
+    recipes = [*added, *removed]
+    if recipes:
+        ShoppingListItem.objects.refresh(
+            [user.pk],
+            IngredientInRecipe.objects.filter(
+                recipe__in=recipes
+            ).values('ingredient')
+        )
+
+
+@receiver(recipe_ingredients_changed)
+def refresh_shopping_lists(recipe_ids, ingredient_ids=None, **kwargs):
+    users = list(ShoppingCart.objects.filter(
+        recipe__in=recipe_ids
+    ).values_list('user', flat=True).distinct())
+    if users:
+        ShoppingListItem.objects.refresh(users, ingredient_ids)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remove_ingredient(instance, **kwargs):
+    """Состав рецептов обновляется после каскадного удаления."""
+    ingredient_ids = [instance.pk]
+    recipe_ids = list(IngredientInRecipe.objects.filter(
+        ingredient=instance
+    ).values_list('recipe', flat=True))
+    if recipe_ids:
+        transaction.on_commit(lambda: recipe_ingredients_changed.send(
+            sender=Ingredient,
+            recipe_ids=recipe_ids,
+            ingredient_ids=ingredient_ids
+        ))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_carts(instance, **kwargs):
+    """Убирает рецепт из корзин до каскадного удаления."""
+    carts = ShoppingCart.objects.filter(recipe=instance)
+    users = list(carts.values_list('user', flat=True))
+    if users:
+        carts.delete()
+        ShoppingListItem.objects.refresh(
+            users,
+            IngredientInRecipe.objects.filter(
+                recipe=instance
+            ).values('ingredient')
+        )
+
+
+@receiver(pre_delete, sender=User)
+def remove_user_favorites(instance, **kwargs):
+    """Каскадное удаление избранного не шлёт user_recipes_changed."""
+    user_recipes_changed.send(
+        sender=Favorite, user=instance,
+        removed=list(Favorite.objects.filter(user=instance).values_list(
+            'recipe', flat=True
+        ))
+    )
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(instance, created, **kwargs):
+    if created and settings.FEED_STRATEGY == 'write':
+        FeedEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_feed(instance, **kwargs):
+    FeedEntry.objects.filter(
+        user=instance.user_id, recipe__author=instance.author_id
+    ).delete()
@@ -0,0 +1,49 @@
+from itertools import groupby
+from operator import itemgetter
+
+# Единица измерения -> (базовая единица, множитель).
+CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'капля': ('мл', 0.05),
+    'ч. л.': ('мл', 5),
+    'ст. л.': ('мл', 15),
+    'стакан': ('мл', 250),
+}
+# Базовая единица -> (крупная единица, множитель), начиная с которого
+# итог показывается в крупной единице.
+LARGER_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+
+
+def convert(unit):
+    unit = ' '.join(unit.split())
+    return CONVERSIONS.get(unit, (unit, 1))
+
+
+def humanize(total, unit):
+    larger, factor = LARGER_UNITS.get(unit, (unit, None))
+    if factor and total >= factor:
+        total, unit = total / factor, larger
+    total = round(total, 2)
+    return int(total) if total == int(total) else total, unit
+
+
+def normalize(rows):
+    """Сводит строки одного ингредиента в разных единицах к общей.
+
+    Строки должны быть упорядочены по name: проход один, в памяти
+    держится только текущая группа, объекты моделей не создаются.
+    """
+    for name, group in groupby(rows, key=itemgetter('name')):
+        totals = {}
+        for row in group:
+            unit, factor = convert(row['measurement_unit'])
+            totals[unit] = totals.get(unit, 0) + row['total'] * factor
+        for unit, total in totals.items():
+            total, unit = humanize(total, unit)
+            yield {'name': name, 'measurement_unit': unit, 'total': total}
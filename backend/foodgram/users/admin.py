@@ -5,7 +5,8 @@ from .models import Subscription, User
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('email', 'username')
-    list_filter = ('email', 'username')
+    list_filter = ('email', 'username')
+    readonly_fields = ('recipes_count', 'subscribers_count')
 
 
 class SubscriptionAdmin(admin.ModelAdmin):